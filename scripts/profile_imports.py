@@ -0,0 +1,62 @@
+import argparse
+import json
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+
+DEFAULT_MODULES = [
+    "src.app.cli",
+    "src.app.rag_runtime",
+    "src.llm.rerank",
+    "src.llm.generate",
+    "src.eval.retrieval_eval",
+]
+
+
+def profile_module(module: str):
+    """
+    Run `python -X importtime -c "import <module>"` in a fresh interpreter and
+    return (total_us, top cumulative imports).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cum_us, name = [p.strip() for p in line[len("import time:"):].split("|")]
+        rows.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cum_us)})
+
+    total_us = next((r["cumulative_us"] for r in reversed(rows) if r["module"] == module), 0)
+    top = sorted(rows, key=lambda r: -r["cumulative_us"])[:15]
+    return {"module": module, "ok": proc.returncode == 0, "total_ms": total_us / 1000, "top": top}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--out_path", type=str, default="logs/import_profile.jsonl")
+    args = parser.parse_args()
+
+    out_path = Path(args.out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    stamp = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+    with out_path.open("a", encoding="utf-8") as f:
+        for m in args.modules:
+            prof = profile_module(m)
+            f.write(json.dumps({"timestamp": stamp, **prof}, ensure_ascii=False) + "\n")
+            status = "OK" if prof["ok"] else "FAIL"
+            print(f"[{status}] {m}: {prof['total_ms']:.1f} ms")
+
+    print(f"[OK] appended: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Chunking-parameter sweep: chunk -> embed (shared cache) -> build -> eval, per grid point.
+
+Run from the project root (so `src` is importable):
+    python -m scripts.sweep_chunking --max_chars 300 450 800 --overlap_sents 0 1 2
+"""
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from scripts.make_chunks import doc_to_chunks, load_jsonl, write_jsonl
+from src.config import EMBED_MODEL
+from src.eval.retrieval_eval import read_questions, run_eval_suite
+from src.eval.search_wrappers import make_vectorstore_search_fn
+from src.llm.embedding_cache import EmbeddingCache
+from src.llm.local_embedding import is_local_model
+from src.retrieval.build_vector_index import build_vector_index
+from src.retrieval.vector_store import VectorStore
+
+
+def variant_name(max_chars: int, overlap_sents: int) -> str:
+    return f"mc{max_chars}_ov{overlap_sents}"
+
+
+def run_variant(
+    docs,
+    *,
+    max_chars: int,
+    overlap_sents: int,
+    out_dir: Path,
+    questions,
+    ks,
+    embed_model: str,
+    cache: EmbeddingCache | None,
+) -> dict:
+    name = variant_name(max_chars, overlap_sents)
+    vdir = out_dir / name
+    chunks_path = vdir / "chunks.jsonl"
+
+    chunks = [c for d in docs for c in doc_to_chunks(d, max_chars=max_chars, overlap_sents=overlap_sents)]
+    write_jsonl(chunks_path, chunks)
+
+    t0 = time.perf_counter()
+    res = build_vector_index(
+        chunks_path=chunks_path,
+        index_path=vdir / "index.bin",
+        meta_path=vdir / "meta.jsonl",
+        embed_model=embed_model,
+        embedding_cache=cache,
+    )
+    build_s = time.perf_counter() - t0
+
+    # doc-level only: chunk ids change with chunking, so gold_chunk_ids don't carry over
+    vs = VectorStore.load(index_path=vdir / "index.bin", meta_path=vdir / "meta.jsonl")
+    # same doc-level search as `cli eval --level doc`: k distinct docs via group_by
+    search_fn = make_vectorstore_search_fn(vs, embed_query=cache.embed_query if cache else None, normalize=True,
+                                           group_by="doc_id")
+    suite = run_eval_suite(
+        questions, ks=ks, search_fn=search_fn, out_path=vdir / "results_vector_doc.json",
+        id_key="doc_id", dedupe=True, label=name,
+    )
+
+    row = {
+        "variant": name,
+        "max_chars": max_chars,
+        "overlap_sents": overlap_sents,
+        "n_chunks": len(chunks),
+        "n_vectors": res.n_vectors,
+        "index_bytes": (vdir / "index.bin").stat().st_size,
+        "build_s": round(build_s, 2),
+    }
+    for k in ks:
+        m = suite["results"][str(k)]
+        row[f"recall@{k}"] = m["recall_at_k"]
+        row[f"mrr@{k}"] = m["mrr_at_k"]
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--in_path", type=str, default="data/samples/sec_docs.jsonl")
+    parser.add_argument("--questions", type=str, default="eval/questions.jsonl")
+    parser.add_argument("--out_dir", type=str, default="eval/sweep")
+    parser.add_argument("--cache_dir", type=str, default="indexes/embed_cache")
+    parser.add_argument("--max_chars", type=int, nargs="+", default=[300, 450, 800])
+    parser.add_argument("--overlap_sents", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embed_model", type=str, default=EMBED_MODEL)
+    args = parser.parse_args()
+
+    out_dir = Path(args.out_dir)
+    docs = load_jsonl(Path(args.in_path))
+    questions = read_questions(Path(args.questions))
+    grid = list(itertools.product(args.max_chars, args.overlap_sents))
+    ks = tuple(args.ks)
+
+    cache = None
+    if not is_local_model(args.embed_model):
+        # embed every distinct chunk text of the whole grid once, up front, so the
+        # parallel builds below are pure cache hits
+        cache = EmbeddingCache(Path(args.cache_dir), model=args.embed_model)
+        texts = {c["text"] for mc, ov in grid for d in docs
+                 for c in doc_to_chunks(d, max_chars=mc, overlap_sents=ov) if c["text"].strip()}
+        missing = [t for t in sorted(texts) if t not in cache]
+        print(f"[sweep] {len(grid)} variants | {len(texts)} distinct chunk texts | {len(missing)} to embed")
+        if missing:
+            cache.embed(missing)
+        cache.embed([q["query"] for q in questions])
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = [
+            ex.submit(run_variant, docs, max_chars=mc, overlap_sents=ov, out_dir=out_dir,
+                      questions=questions, ks=ks, embed_model=args.embed_model, cache=cache)
+            for mc, ov in grid
+        ]
+        rows = [f.result() for f in futures]
+
+    # rank: quality (MRR@k0, then Recall@k_last), then smaller index, then faster build
+    k0, kl = ks[0], ks[-1]
+    rows.sort(key=lambda r: (-r[f"mrr@{k0}"], -r[f"recall@{kl}"], r["index_bytes"], r["build_s"]))
+
+    cols = ["variant", "n_chunks", "index_bytes", "build_s"] + [f"{m}@{k}" for k in ks for m in ("recall", "mrr")]
+    lines = ["| rank | " + " | ".join(cols) + " |", "|" + "---|" * (len(cols) + 1)]
+    for i, r in enumerate(rows, start=1):
+        cells = [f"{r[c]:.4f}" if isinstance(r[c], float) and "@" in c else str(r[c]) for c in cols]
+        lines.append(f"| {i} | " + " | ".join(cells) + " |")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "summary.json").write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+    (out_dir / "summary.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    print("\n".join(lines))
+    if cache is not None:
+        print(f"[sweep] embedding cache: {len(cache)} vectors | hits={cache.hits} misses={cache.misses}")
+    print(f"[OK] wrote: {out_dir / 'summary.md'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,214 @@
 # src/app/cli.py
 from __future__ import annotations
 
+# Keep module-level imports light: heavy modules (faiss, numpy, openai, tqdm) are
+# imported inside each subcommand so `query` does not pay for `eval`/`build`.
+import argparse
 from pathlib import Path
 
-from src.retrieval.build_vector_index import build_vector_index
-from src.eval.retrieval_eval import read_questions, run_eval_suite
-from src.llm.embedding import embed_query
-from src.retrieval.vector_store import VectorStore
-from src.eval.search_wrappers import make_vectorstore_search_fn, make_llm_rerank_search_fn
-
-# (optional) runtime helper: context+generate
-from src.llm.context import build_context
-from src.llm.generate import rag_generate_with_retry
-
-
-def main():
-    root = Path.cwd().resolve()
-    assert (root / "src").exists(), f"Run from project root (invest-rag/). cwd={root}"
-
-    # paths
-    chunks_path = root / "data" / "processed" / "chunks.jsonl"
-    index_dir   = root / "indexes" / "faiss"
-    index_path  = index_dir / "index.bin"
-    meta_path   = index_dir / "meta.jsonl"
-    q_path      = root / "eval" / "questions.jsonl"
-    eval_dir    = root / "eval"
-
-    # 1) build index (only if missing)
-    if not index_path.exists() or not meta_path.exists():
-        print("[1/3] Building index...")
-        build_vector_index(
-            chunks_path=chunks_path,
-            index_path=index_path,
-            meta_path=meta_path,
-            save_text_in_meta=True,
+from src.config import RERANK_MODE, RERANK_MODEL
+from src.llm.rerank import RERANK_MODES
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def cmd_build(args: argparse.Namespace) -> None:
+    from src.retrieval.build_vector_index import build_versioned_index
+    from src.retrieval.artifacts import read_current_version
+
+    index_root = Path(args.index_dir)
+    if read_current_version(index_root) and not args.force:
+        print(f"[build] Index exists (version {read_current_version(index_root)}). Use --force to rebuild.")
+        return
+
+    extra = {}
+    if args.coarse_dim is not None:
+        extra["coarse_dim"] = args.coarse_dim or None   # 0 disables the coarse pass
+    if args.doc_pooling is not None:
+        extra["doc_pooling"] = None if args.doc_pooling == "none" else args.doc_pooling
+    if args.batch:
+        from src.llm.batch import make_executor
+        extra["batch_executor"] = make_executor(args.batch)
+
+    res = build_versioned_index(chunks_path=Path(args.chunks_path), index_root=index_root, force=args.force, **extra)
+    state = "reused" if res.reused else "built"
+    print(f"[build] {state} version {res.version_id} -> {res.version_dir}")
+
+
+def cmd_query(args: argparse.Namespace) -> None:
+    from src.app import rag_runtime
+
+    if args.no_generate:
+        retrieved = rag_runtime.retrieve(args.query, use_rerank=args.rerank, k_ctx=args.top_k, rerank_mode=args.rerank_mode)
+        for r in retrieved:
+            print(f"{r.get('rank'):>3}  {r.get('score', 0.0):.4f}  {r.get('doc_id')}  {r.get('chunk_id')}")
+        return
+
+    out = rag_runtime.answer(args.query, use_rerank=args.rerank, k_ctx=args.top_k, rerank_mode=args.rerank_mode)
+    label = "RERANK" if args.rerank else "VECTOR"
+    top = out["retrieved"][0] if out["retrieved"] else {}
+    print(f"[{label}] Q: {args.query}")
+    print(f"[{label}] top1_doc: {top.get('doc_id')}")
+    print(f"[{label}] citations_valid: {out['grounded']}")
+    if out.get("gated"):
+        print(f"[{label}] gated: out-of-scope (no LLM calls)")
+    if out.get("speculation"):
+        print(f"[{label}] speculation: {out['speculation']} | stats: {rag_runtime.speculation_stats()}")
+    print(f"[{label}] answer:\n{out['answer']}")
+
+
+def cmd_eval(args: argparse.Namespace) -> None:
+    from src.app.rag_runtime import current_version, get_store
+    from src.eval.report import pareto_report, write_pareto_report
+    from src.eval.retrieval_eval import read_questions, run_eval_suite
+    from src.eval.search_wrappers import make_alias_expanded_search_fn, make_vectorstore_search_fn, make_llm_rerank_search_fn
+    from src.llm.embedding import embed_query
+
+    questions = read_questions(Path(args.questions))
+    eval_dir = Path(args.out_dir)
+    id_key, dedupe = ("doc_id", True) if args.level == "doc" else ("chunk_id", False)
+    # doc level: collapse by doc_id so k results are k distinct docs (not k chunks, deduped)
+    group_by = "doc_id" if args.level == "doc" else None
+    # chunk level: near-duplicates collapsed at build time are scored as their own chunk ids
+    expand_aliases = args.level == "chunk"
+
+    vs = get_store()
+    vector_search_fn = make_vectorstore_search_fn(vs, embed_query=embed_query, normalize=True, group_by=group_by, doc_first=args.doc_first)
+    if args.batch and not args.no_rerank:
+        # submit the rerank batch now; it runs while the vector suite is scored
+        from src.eval.search_wrappers import make_batch_rerank_search_fn
+        from src.llm.batch import make_executor
+        rerank_search_fn = make_batch_rerank_search_fn(
+            vector_search_fn, [q["query"] for q in questions], k_vec=10,
+            executor=make_executor(args.batch), work_dir=eval_dir / "batch", mode=args.rerank_mode,
         )
     else:
-        print("[1/3] Index exists. Skip build.")
-
-    # 2) eval (vector vs rerank)
-    print("[2/3] Running eval...")
-    questions = read_questions(q_path)
-
-    vs = VectorStore.load(index_path=index_path, meta_path=meta_path)
-    vector_search_fn = make_vectorstore_search_fn(vs, embed_query=embed_query, normalize=True)
-    rerank_search_fn = make_llm_rerank_search_fn(vector_search_fn, k_vec=10)
-
-    vec_out = eval_dir / "results_vector_doc.json"
-    rr_out  = eval_dir / "results_rerank_llm_doc.json"
-
-    vec_suite = run_eval_suite(questions, ks=(1, 3, 5, 10), search_fn=vector_search_fn, out_path=vec_out, id_key="doc_id", dedupe=True, label='Vector')
-    rr_suite  = run_eval_suite(questions, ks=(1, 3, 5, 10), search_fn=rerank_search_fn, out_path=rr_out,  id_key="doc_id", dedupe=True, label='Rerank')
-
-    v_mrr1 = vec_suite["results"]["1"]["mrr_at_k"]
-    r_mrr1 = rr_suite["results"]["1"]["mrr_at_k"]
-    print(f"[eval] Vector MRR@1={v_mrr1:.4f} | Rerank MRR@1={r_mrr1:.4f} | Δ={r_mrr1 - v_mrr1:+.4f}")
+        rerank_search_fn = make_llm_rerank_search_fn(vector_search_fn, k_vec=10, mode=args.rerank_mode)
+    batch_stats, batch_join = getattr(rerank_search_fn, "batch_stats", None), getattr(rerank_search_fn, "join", None)
+    if expand_aliases:
+        # after rerank, so the reranker does not see the same text twice
+        vector_search_fn = make_alias_expanded_search_fn(vector_search_fn)
+        rerank_search_fn = make_alias_expanded_search_fn(rerank_search_fn)
+
+    vec_out = eval_dir / f"results_vector_{args.level}.json"
+    rr_name = "rerank_llm" if args.rerank_mode == "top1" else f"rerank_{args.rerank_mode}"
+    rr_out  = eval_dir / f"results_{rr_name}_{args.level}.json"
+    ckpt = (lambda name: eval_dir / f"predictions_{name}_{args.level}.jsonl") if args.checkpoint else (lambda name: None)
+    # checkpoints are only resumed for the same index version + search config
+    ckpt_meta = {"index_version": current_version(), "level": args.level, "group_by": group_by, "doc_first": args.doc_first, "expand_aliases": expand_aliases}
+
+    if args.pipelined:
+        # batched embed -> one batched search -> rerank fan-out; no per-question calls
+        from src.eval.retrieval_eval import run_pipelined_eval_suite, run_vector_stage
+        # one embed + search pass, deep enough for both suites
+        stage = run_vector_stage(questions, vs=vs, depth=max(max(args.ks), 10), group_by=group_by)
+        common = dict(vs=vs, ks=tuple(args.ks), group_by=group_by, expand_aliases=expand_aliases, vector_stage=stage, id_key=id_key, dedupe=dedupe, max_workers=args.workers)
+        run_vec = lambda: run_pipelined_eval_suite(questions, out_path=vec_out, label="Vector", **common)
+        run_rr = lambda: run_pipelined_eval_suite(questions, out_path=rr_out, label="Rerank", rerank=True, k_vec=10, rerank_mode=args.rerank_mode, **common)
+    else:
+        run_vec = lambda: run_eval_suite(questions, ks=tuple(args.ks), search_fn=vector_search_fn, out_path=vec_out, id_key=id_key, dedupe=dedupe, label="Vector", max_workers=args.workers, checkpoint_path=ckpt("vector"), checkpoint_meta={**ckpt_meta, "search": "vector"})
+        rr_kw = dict(checkpoint_path=ckpt("rerank" if args.rerank_mode == "top1" else rr_name), checkpoint_meta={**ckpt_meta, "search": rr_name, "rerank_model": RERANK_MODEL, "rerank_mode": args.rerank_mode, "k_vec": 10, "batch": args.batch})
+        if args.batch:
+            # one batch wait instead of per-query latency: join first, report it separately
+            rr_kw.update(per_query_latency=False, suite_extra={"batch": batch_stats})
+        run_rr = lambda: run_eval_suite(questions, ks=tuple(args.ks), search_fn=rerank_search_fn, out_path=rr_out, id_key=id_key, dedupe=dedupe, label="Rerank", max_workers=args.workers, **rr_kw)
+
+    vec_suite = run_vec()
     print(f"[eval] wrote: {vec_out}")
-    print(f"[eval] wrote: {rr_out}")
-
-    # 3) demo answers (few queries)
-    print("[3/3] Demo queries (vector vs rerank)...")
-    demo_queries = [
-        "Which product is described as the company’s first spatial computer, and what operating system is it based on?",
-        "In Apple’s Home product description, which device is a media streaming and gaming device, and which operating system is it based on?",
-    ]
-
-    def run_once(q: str, search_fn, label: str):
-        retrieved = search_fn(q, 5)
-
-        top = retrieved[0] if retrieved else {}
-        top_doc = top.get("doc_id")
-        top_section = top.get("section")
-        top_snippet = (top.get("text") or top.get("content") or "")[:220].replace("\n", " ")
-
-        ctx = build_context(retrieved)
-        ans, citations_valid = rag_generate_with_retry(q, ctx, retrieved)
-
-        print("\n" + "-" * 90)
-        print(f"[{label}] Q: {q}")
-        print(f"[{label}] top1_doc: {top_doc}")
-        if top_section:
-            print(f"[{label}] top1_section: {top_section}")
-        print(f"[{label}] citations_valid: {citations_valid}")
-        print(f"[{label}] top1_snippet: {top_snippet}")
-        print(f"[{label}] answer:\n{ans}")
-
-    for q in demo_queries:
-        run_once(q, vector_search_fn, "VECTOR")
-        run_once(q, rerank_search_fn, "RERANK")
+    suites = {f"vector_{args.level}": vec_suite}
+
+    if not args.no_rerank:
+        if batch_join is not None:
+            batch_join()
+            print(f"[eval] rerank batch: {batch_stats}")
+        rr_suite  = run_rr()
+        print(f"[eval] wrote: {rr_out}")
+        suites[f"{rr_name}_{args.level}"] = rr_suite
+
+        k0 = str(args.ks[0])
+        v_mrr = vec_suite["results"][k0]["mrr_at_k"]
+        r_mrr = rr_suite["results"][k0]["mrr_at_k"]
+        print(f"[eval] Vector MRR@{k0}={v_mrr:.4f} | Rerank MRR@{k0}={r_mrr:.4f} | Δ={r_mrr - v_mrr:+.4f}")
+
+    # quality vs latency / cost (Pareto frontier per k)
+    report_path = eval_dir / f"report_{args.level}.md"
+    write_pareto_report([row for k in args.ks for row in pareto_report(suites, k=k)], report_path)
+    print(f"[eval] wrote: {report_path}")
+
+
+def cmd_gate(args: argparse.Namespace) -> None:
+    from dataclasses import replace
+    from src.app.rag_runtime import current_embed_model, current_version, get_store
+    from src.config import RELEVANCE_GATE_PATH, GATE_MAX_FALSE_REFUSAL
+    from src.eval.retrieval_eval import read_questions
+    from src.eval.search_wrappers import make_vectorstore_search_fn
+    from src.llm.embedding import embed_query
+    from src.retrieval.relevance_gate import calibrate_gate
+
+    questions = read_questions(Path(args.questions))
+    search_fn = make_vectorstore_search_fn(get_store(), embed_query=embed_query, normalize=True)
+    max_frr = GATE_MAX_FALSE_REFUSAL if args.max_false_refusal is None else args.max_false_refusal
+    gate = calibrate_gate(questions, search_fn=search_fn, max_false_refusal=max_frr)
+    # thresholds are raw scores of this index: the runtime only applies them to it
+    gate = replace(gate, index_version=current_version(), embed_model=current_embed_model())
+    gate.save(RELEVANCE_GATE_PATH)
+
+    orr = "n/a" if gate.ood_refusal_rate is None else f"{gate.ood_refusal_rate:.3f}"
+    print(f"[gate] index={gate.index_version} ({gate.embed_model}) | min_top1={gate.min_top1:.4f} min_overlap={gate.min_overlap}")
+    print(f"[gate] false_refusal_rate={gate.false_refusal_rate:.3f} (n={gate.n_in_scope}) | ood_refusal_rate={orr} (n={gate.n_ood})")
+    print(f"[gate] wrote: {RELEVANCE_GATE_PATH}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.app.cli", description="invest-rag: build / query / eval / gate")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Build a versioned FAISS index from chunks.jsonl")
+    p.add_argument("--chunks_path", type=str, default=str(ROOT / "data" / "processed" / "chunks.jsonl"))
+    p.add_argument("--index_dir", type=str, default=str(ROOT / "indexes" / "faiss"))
+    p.add_argument("--force", action="store_true", help="Rebuild even if a current version exists (as a new version; never reuses an existing one)")
+    p.add_argument("--batch", choices=("local", "openai"), default=None, help="Embed via an offline batch file")
+    p.add_argument("--coarse_dim", type=int, default=None, help="Matryoshka prefix dim for the coarse first pass (0 = off; default: config COARSE_DIM)")
+    p.add_argument("--doc_pooling", choices=("mean", "max", "none"), default=None, help="Pooled doc-level index for eval --doc_first (default: config DOC_POOLING)")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("query", help="Retrieve (+ optional rerank) and generate a grounded answer")
+    p.add_argument("--query", type=str, required=True)
+    p.add_argument("--top_k", type=int, default=5)
+    p.add_argument("--rerank", action="store_true")
+    p.add_argument("--no_generate", action="store_true", help="Print retrieved hits only")
+    p.add_argument("--rerank_mode", choices=RERANK_MODES, default=RERANK_MODE)
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("eval", help="Recall@k / MRR@k for vector vs rerank")
+    p.add_argument("--questions", type=str, default=str(ROOT / "eval" / "questions.jsonl"))
+    p.add_argument("--out_dir", type=str, default=str(ROOT / "eval"))
+    p.add_argument("--level", choices=("doc", "chunk"), default="doc")
+    p.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10])
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--checkpoint", action="store_true", help="Save/resume per-question predictions")
+    p.add_argument("--no_rerank", action="store_true")
+    p.add_argument("--rerank_mode", choices=RERANK_MODES, default=RERANK_MODE, help="top1 promotion or listwise full ordering")
+    p.add_argument("--batch", choices=("local", "openai"), default=None, help="Rerank via one offline batch file")
+    p.add_argument("--doc_first", action="store_true", help="Pooled doc index first, then those docs' chunks (index built with --doc_pooling)")
+    p.add_argument("--pipelined", action="store_true", help="Batch-embed all questions, one batched search, rerank fan-out over --workers threads (no checkpoints)")
+    p.set_defaults(func=cmd_eval)
+
+    p = sub.add_parser("gate", help="Calibrate the out-of-scope relevance gate on eval questions")
+    p.add_argument("--questions", type=str, default=str(ROOT / "eval" / "questions.jsonl"))
+    p.add_argument("--max_false_refusal", type=float, default=None)
+    p.set_defaults(func=cmd_gate)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "pipelined", False) and (args.batch or args.checkpoint or args.doc_first):
+        parser.error("--pipelined cannot be combined with --batch, --checkpoint or --doc_first")
+    args.func(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,42 +1,289 @@
 # src/app/rag_runtime.py
 from __future__ import annotations
 
-from src.config import USE_RERANK_DEFAULT, K_VEC, K_CTX, RERANK_MODEL
-from src.retrieval.vector_store import VectorStore
-from src.llm.rerank import llm_rerank_top1, promote_chosen_to_top
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+import json
+import threading
+
+from src.config import (
+    USE_RERANK_DEFAULT, K_VEC, K_CTX, RERANK_MODEL, RERANK_MODE, INDEX_DIR, INDEX_WATCH_INTERVAL_S, RELEVANCE_GATE_PATH,
+    SPECULATIVE_GENERATION,
+)
+from src.retrieval.artifacts import read_current_version, current_version_dir
+from src.retrieval.hits import to_dicts
+from src.retrieval.relevance_gate import NOT_ENOUGH_INFO, RelevanceGate
+from src.retrieval.vector_store import VectorStore, l2_normalize
+from src.llm.client import ModelCallError
+from src.llm.embedding import embed_query
+from src.llm.rerank import apply_order, llm_rerank_order
 from src.llm.context import build_context
 from src.llm.generate import rag_generate_with_retry
 
-_STORE: VectorStore | None = None
 
-def get_store() -> VectorStore:
+@dataclass
+class _StoreSlot:
+    version: str | None           # None = legacy flat layout (INDEX_DIR/index.bin)
+    store: VectorStore | None
+    embed_model: str | None = None
+    gate: RelevanceGate | None = None   # calibrated for this version, else None
+    inflight: int = 0
+    retired: bool = False
+
+
+_STORE: _StoreSlot | None = None
+_LOCK = threading.Lock()
+_WATCHER: threading.Thread | None = None
+_WATCH_STOP = threading.Event()
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag")
+_SPEC_LOCK = threading.Lock()
+# wasted: speculative generations sent and then discarded; cancelled: dropped before sending
+_SPEC_STATS = {"hits": 0, "misses": 0, "wasted": 0, "cancelled": 0}
+
+
+def _load_slot(index_root: Path = INDEX_DIR) -> _StoreSlot:
+    version = read_current_version(index_root)
+    d = current_version_dir(index_root) or index_root
+    store = VectorStore.load(
+        index_path=d / "index.bin",
+        meta_path=d / "meta.jsonl",
+        coarse_index_path=d / "index_coarse.bin",
+        doc_index_path=d / "doc_index.bin",
+    )
+    cfg_path = d / "build_config.json"
+    embed_model = json.loads(cfg_path.read_text(encoding="utf-8")).get("embed_model") if cfg_path.exists() else None
+    return _StoreSlot(version=version, store=store, embed_model=embed_model, gate=_load_gate(version, embed_model))
+
+
+def _load_gate(version: str | None, embed_model: str | None) -> RelevanceGate | None:
+    """The calibrated gate if it was calibrated on this index (its thresholds are raw scores)."""
+    if not RELEVANCE_GATE_PATH.exists():
+        return None
+    gate = RelevanceGate.load(RELEVANCE_GATE_PATH)
+    if not gate.matches(version, embed_model):
+        print(f"[warn] relevance gate was calibrated on index {gate.index_version} ({gate.embed_model}), "
+              f"serving {version} ({embed_model}): gate disabled until `cli gate` is re-run")
+        return None
+    return gate
+
+
+def _acquire() -> _StoreSlot:
     global _STORE
-    if _STORE is None:
-        _STORE = VectorStore.load()
-    return _STORE
+    with _LOCK:
+        if _STORE is None:
+            _STORE = _load_slot()
+            if INDEX_WATCH_INTERVAL_S > 0:
+                start_index_watcher(INDEX_WATCH_INTERVAL_S)
+        _STORE.inflight += 1
+        return _STORE
+
+
+def _release(slot: _StoreSlot) -> None:
+    with _LOCK:
+        slot.inflight -= 1
+        if slot.retired and slot.inflight == 0:
+            slot.store = None  # last reader gone -> FAISS index + meta can be freed
+
+
+def _swap(new_slot: _StoreSlot) -> None:
+    global _STORE
+    with _LOCK:
+        old, _STORE = _STORE, new_slot
+        if old is not None:
+            old.retired = True
+            if old.inflight == 0:
+                old.store = None
+
+
+@contextmanager
+def store_lease() -> Iterator[VectorStore]:
+    """Pin the current index version for the duration of one query (safe across hot-swaps)."""
+    slot = _acquire()
+    try:
+        yield slot.store
+    finally:
+        _release(slot)
+
+
+def get_store() -> VectorStore:
+    with store_lease() as store:
+        return store
+
+
+def current_version() -> str | None:
+    """Version id of the index being served (None for the legacy flat layout)."""
+    with store_lease():
+        return _STORE.version
+
+
+def current_embed_model() -> str | None:
+    """embed_model from the served index's build_config.json."""
+    with store_lease():
+        return _STORE.embed_model
+
+
+def reload_if_changed(index_root: Path = INDEX_DIR) -> bool:
+    """Load the version CURRENT points to (outside the lock) and swap it in if it changed."""
+    current = _STORE.version if _STORE is not None else None
+    if read_current_version(index_root) == current:
+        return False
+    _swap(_load_slot(index_root))
+    return True
 
-def retrieve(query: str, use_rerank: bool = USE_RERANK_DEFAULT, k_vec: int = K_VEC, k_ctx: int = K_CTX) -> list[dict]:
-    store = get_store()
-    if not use_rerank:
-        return store.search(query, k=k_ctx)
 
-    # rerank: vector top-k_vec -> LLM pick best -> promote
-    cands = store.search(query, k=k_vec)
+def _watch_loop(interval_s: float) -> None:
+    while not _WATCH_STOP.wait(interval_s):
+        try:
+            if reload_if_changed():
+                print(f"[index] swapped to version {_STORE.version}")
+        except Exception as e:
+            # keep serving the old version; retry on the next tick
+            print(f"[warn] index reload failed: {e}")
+
+
+def start_index_watcher(interval_s: float = INDEX_WATCH_INTERVAL_S) -> None:
+    global _WATCHER
+    if _WATCHER is not None and _WATCHER.is_alive():
+        return
+    _WATCH_STOP.clear()
+    _WATCHER = threading.Thread(target=_watch_loop, args=(interval_s,), name="index-watcher", daemon=True)
+    _WATCHER.start()
+
+
+def stop_index_watcher() -> None:
+    _WATCH_STOP.set()
+
+
+def _search(store: VectorStore, query: str, k: int) -> list[dict]:
+    embed = store.query_embedder or embed_query
+    qv = l2_normalize(embed(query))
+    return store.search_by_vector(qv, k=k)
+
+
+def _candidates(query: str, use_rerank: bool, k_vec: int, k_ctx: int) -> list[dict]:
+    with store_lease() as store:
+        return _search(store, query, k_vec if use_rerank else k_ctx)
+
+
+def _rerank_order(query: str, cands: list[dict], mode: str) -> list[int]:
+    # rerank is an optimization: a failed / open-circuit call keeps the vector order
+    try:
+        return llm_rerank_order(query, cands, mode=mode, model=RERANK_MODEL)
+    except ModelCallError as e:
+        print(f"[warn] rerank unavailable, using vector order: {e}")
+        return list(range(len(cands)))
+
+
+def _rerank(query: str, cands: list[dict], k_ctx: int, mode: str = RERANK_MODE) -> list[dict]:
+    # rerank: vector top-k_vec -> LLM ordering (top1 pick or full listwise) -> top k_ctx
     if not cands:
         return []
 
-    chosen_i = llm_rerank_top1(query, cands, model=RERANK_MODEL)
-    reranked = promote_chosen_to_top(cands, chosen_i)
+    reranked = apply_order(cands, _rerank_order(query, cands, mode))
     return reranked[:k_ctx]
 
-def answer(query: str, use_rerank: bool = USE_RERANK_DEFAULT) -> dict:
-    retrieved = retrieve(query, use_rerank=use_rerank)
-    ctx = build_context(retrieved)
-    ans, grounded = rag_generate_with_retry(query, ctx, retrieved)
+
+def retrieve(
+    query: str,
+    use_rerank: bool = USE_RERANK_DEFAULT,
+    k_vec: int = K_VEC,
+    k_ctx: int = K_CTX,
+    rerank_mode: str = RERANK_MODE,
+) -> list[dict]:
+    cands = _candidates(query, use_rerank, k_vec, k_ctx)
+    if not use_rerank:
+        return cands
+    return _rerank(query, cands, k_ctx, rerank_mode)
+
+
+def get_gate() -> RelevanceGate | None:
+    """
+    Relevance gate of the served index version (reloaded with it on every swap); None
+    until `python -m src.app.cli gate` has calibrated it on this version.
+    """
+    with store_lease():
+        return _STORE.gate
+
+
+def speculation_stats() -> dict:
+    with _SPEC_LOCK:
+        n = _SPEC_STATS["hits"] + _SPEC_STATS["misses"]
+        return {
+            **_SPEC_STATS,
+            "n": n,
+            "hit_rate": _SPEC_STATS["hits"] / n if n else None,
+            "wasted_rate": _SPEC_STATS["wasted"] / n if n else None,
+        }
+
+
+def _generate(query: str, retrieved: list[dict]) -> tuple[str, bool]:
+    return rag_generate_with_retry(query, build_context(retrieved), retrieved)
+
+
+def _answer_speculative(query: str, cands: list[dict], k_ctx: int, mode: str) -> tuple[list[dict], str, bool, str]:
+    """
+    Overlap generation with rerank:
+    - start generating from the vector top-k_ctx context while the LLM reranker runs
+    - reranking only reorders, so if the reranked top-k_ctx is the same set of items
+      the speculative answer is kept (hit); otherwise regenerate (miss)
+    """
+    spec_items = [dict(r) for r in cands[:k_ctx]]   # copies: apply_order mutates rank
+    gen_f = _POOL.submit(_generate, query, spec_items)
+    # rerank on the calling thread: queued behind other requests' generations on the
+    # pool it would be slower than the sequential path under load
+    order = _rerank_order(query, cands, mode)
+    retrieved = apply_order(cands, order)[:k_ctx]
+    hit = all(i < len(spec_items) for i in order[:k_ctx])
+    # on a miss, drop the speculative call if it is still queued; once running it is wasted
+    cancelled = not hit and gen_f.cancel()
+    with _SPEC_LOCK:
+        _SPEC_STATS["hits" if hit else "misses"] += 1
+        if not hit:
+            _SPEC_STATS["cancelled" if cancelled else "wasted"] += 1
+
+    if hit:
+        ans, grounded = gen_f.result()
+        return retrieved, ans, grounded, "hit"
+    ans, grounded = _generate(query, retrieved)
+    return retrieved, ans, grounded, "miss"
+
+
+def answer(
+    query: str,
+    use_rerank: bool = USE_RERANK_DEFAULT,
+    k_ctx: int = K_CTX,
+    speculative: bool = SPECULATIVE_GENERATION,
+    rerank_mode: str = RERANK_MODE,
+) -> dict:
+    cands = _candidates(query, use_rerank, K_VEC, k_ctx)
+
+    # out-of-scope short-circuit: no rerank / generation calls when evidence is too weak
+    gate = get_gate()
+    if gate is not None and not gate.passes(query, cands):
+        return {
+            "query": query,
+            "use_rerank": use_rerank,
+            "retrieved": [],
+            "answer": NOT_ENOUGH_INFO,
+            "grounded": True,
+            "gated": True,
+        }
+
+    speculation = None
+    if use_rerank and speculative and cands:
+        retrieved, ans, grounded, speculation = _answer_speculative(query, cands, k_ctx, rerank_mode)
+    else:
+        retrieved = _rerank(query, cands, k_ctx, rerank_mode) if use_rerank else cands
+        ans, grounded = _generate(query, retrieved)
     return {
         "query": query,
         "use_rerank": use_rerank,
-        "retrieved": retrieved,
+        "retrieved": to_dicts(retrieved),   # plain dicts for JSON / API callers
         "answer": ans,
         "grounded": grounded,
-    }
\ No newline at end of file
+        "gated": False,
+        "speculation": speculation,
+    }
@@ -6,13 +6,82 @@ import os
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMBED_MODEL = "text-embedding-3-small"
+# "local-lsa" selects the offline TF-IDF + SVD backend (src/llm/local_embedding.py)
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+LOCAL_EMBED_DIM = 256
 RERANK_MODEL = "gpt-4.1-mini"
+# "top1": LLM picks the best candidate, rest keep vector order; "listwise": one call
+# returns the full ordering (see src/llm/rerank.py)
+RERANK_MODE = os.getenv("RERANK_MODE", "top1")
+# Approximate token budget for each candidate excerpt in a listwise prompt
+RERANK_EXCERPT_TOKENS = 80
 GEN_MODEL = "gpt-4.1-mini"
 BATCH_SIZE = 64
 INDEX_TYPE = "IndexFlatIP"
 NORMALIZE = True
 
+# ---- Coarse-to-fine (Matryoshka) search ----
+# Width of the truncated, re-normalized embedding prefix stored in a second
+# FAISS index for the first-pass scan. None disables the coarse index.
+COARSE_DIM = None
+# First pass fetches k * COARSE_OVERFETCH candidates, re-scored with full vectors
+# read from a memory-mapped float16 copy (the full FAISS index is not loaded)
+COARSE_OVERFETCH = 4
+
+# ---- Doc-level pooled index ----
+# "mean" / "max" pools chunk vectors per doc_id into doc_index.bin; None disables it
+DOC_POOLING = None
+# doc-first search shortlists k * DOC_FIRST_OVERFETCH docs by pooled vector, then keeps
+# the k whose best chunk scores highest (the chunk stage can replace a bad doc choice)
+DOC_FIRST_OVERFETCH = 3
+
+# ---- Near-duplicate collapse at build time ----
+# Chunks with cosine >= DEDUP_THRESHOLD share one canonical vector (others kept as
+# "aliases" in meta.jsonl, across docs too; doc-level search resolves them by doc_id).
+# None disables it.
+DEDUP_THRESHOLD = None
+
+# ---- Runtime ----
+# Index root: versions/<id>/ + CURRENT pointer (falls back to index.bin/meta.jsonl here)
+INDEX_DIR = Path(__file__).resolve().parents[1] / "indexes" / "faiss"
+USE_RERANK_DEFAULT = False
+K_VEC = 10
+K_CTX = 5
+# With rerank: generate from the vector top-k while the reranker runs, keep that answer
+# when the reranked pick is already in its context (see rag_runtime.answer)
+SPECULATIVE_GENERATION = True
+# Seconds between checks of INDEX_DIR/CURRENT for a new version (0 disables hot-swap)
+INDEX_WATCH_INTERVAL_S = 5.0
+
+# ---- Out-of-scope short-circuit (see src/retrieval/relevance_gate.py) ----
+# Calibrated thresholds; the gate is off until this file exists
+RELEVANCE_GATE_PATH = Path(__file__).resolve().parents[1] / "eval" / "relevance_gate.json"
+GATE_MAX_FALSE_REFUSAL = 0.025
+
+# ---- Model client (see src/llm/client.py) ----
+MODEL_POOL_MAX_CONNECTIONS = 32
+# Per-attempt timeouts (seconds); retries stop at the call's overall deadline
+EMBED_TIMEOUT_S = 30.0
+QUERY_EMBED_TIMEOUT_S = 5.0
+RERANK_TIMEOUT_S = 20.0
+GEN_TIMEOUT_S = 60.0
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_S = 0.5
+RETRY_MAX_DELAY_S = 8.0
+# Retries may add at most this fraction of call volume (plus RETRY_BUDGET_MIN spare tokens)
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN = 10
+# Consecutive retryable failures that open a per-kind circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_S = 30.0
+# Send a duplicate query-embedding request if the first is still pending (None disables)
+QUERY_EMBED_HEDGE_AFTER_S = 0.5
+
+# ---- Offline batch mode (see src/llm/batch.py) ----
+# Seconds between batch status checks; provider completion window
+BATCH_POLL_INTERVAL_S = 30.0
+BATCH_COMPLETION_WINDOW = "24h"
+
 # ---- RAG context formatting ----
 # Max characters to include per retrieved item (doc/chunk)
 MAX_CHARS_PER_DOC = 1400
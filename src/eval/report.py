@@ -0,0 +1,71 @@
+# src/eval/report.py
+from __future__ import annotations
+
+from pathlib import Path
+import json
+
+
+def load_suites(paths: list[Path]) -> dict[str, dict]:
+    """results_*.json files written by run_eval_suite -> {config name: suite}."""
+    return {p.stem.removeprefix("results_"): json.loads(p.read_text(encoding="utf-8")) for p in paths}
+
+
+def _per_query(usage: dict, key: str, n: int) -> float:
+    return usage.get(key, 0) / n if n else 0.0
+
+
+def pareto_report(suites: dict[str, dict], *, k: int = 1, quality: str = "mrr_at_k") -> list[dict]:
+    """
+    One row per configuration at cutoff k: quality, latency percentiles and per-query
+    API cost. A row is on the Pareto frontier when no other configuration is at least
+    as good on quality, p50 latency and tokens/query and strictly better on one.
+    """
+    rows = []
+    for name, suite in suites.items():
+        m = suite["results"][str(k)]
+        lat = m.get("latency_ms") or {}
+        usage = m.get("usage") or {}
+        n = m.get("n_scored", 0)
+        rows.append({
+            "config": name,
+            "k": k,
+            quality: m[quality],
+            "recall_at_k": m["recall_at_k"],
+            "latency_p50_ms": lat.get("p50"),
+            "latency_p90_ms": lat.get("p90"),
+            "latency_p99_ms": lat.get("p99"),
+            "llm_calls_per_q": _per_query(usage, "llm_calls", n),
+            "embedding_calls_per_q": _per_query(usage, "embedding_calls", n),
+            "tokens_per_q": _per_query(usage, "prompt_tokens", n) + _per_query(usage, "completion_tokens", n),
+        })
+
+    def key(r: dict) -> tuple[float, float, float]:
+        lat = r["latency_p50_ms"] if r["latency_p50_ms"] is not None else float("inf")
+        return (r[quality], -lat, -r["tokens_per_q"])   # all "higher is better"
+
+    for r in rows:
+        kr = key(r)
+        r["pareto"] = not any(
+            all(a >= b for a, b in zip(key(o), kr)) and key(o) != kr
+            for o in rows if o is not r
+        )
+    return sorted(rows, key=lambda r: (-r[quality], r["tokens_per_q"]))
+
+
+def write_pareto_report(rows: list[dict], path: Path, *, quality: str = "mrr_at_k") -> None:
+    def fmt(x, spec: str) -> str:
+        return "-" if x is None else format(x, spec)
+
+    lines = [
+        f"| config | k | {quality} | recall_at_k | p50 ms | p90 ms | p99 ms | LLM calls/q | embed calls/q | tokens/q | Pareto |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in rows:
+        lines.append(
+            f"| {r['config']} | {r['k']} | {fmt(r[quality], '.4f')} | {fmt(r['recall_at_k'], '.3f')} "
+            f"| {fmt(r['latency_p50_ms'], '.1f')} | {fmt(r['latency_p90_ms'], '.1f')} | {fmt(r['latency_p99_ms'], '.1f')} "
+            f"| {fmt(r['llm_calls_per_q'], '.2f')} | {fmt(r['embedding_calls_per_q'], '.2f')} "
+            f"| {fmt(r['tokens_per_q'], '.0f')} | {'✓' if r['pareto'] else ''} |"
+        )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
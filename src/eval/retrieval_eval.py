@@ -2,11 +2,19 @@
 from __future__ import annotations
 
 import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable, Iterable
 from tqdm import tqdm
 import numpy as np
 
+from src.llm.client import charge_usage, deferred_usage, usage_snapshot, usage_since
+from src.retrieval.hits import to_dicts
+
 
 SearchFn = Callable[[str, int], list[dict]]  # query, k -> ranked results (dicts)
 
@@ -36,22 +44,179 @@ def _dedupe_keep_order(items: Iterable[str], k: int) -> list[str]:
     return out
 
 
-def evaluate_retrieval(
+def _score_one(res: list[dict], gold: set[str], *, k: int, id_key: str, dedupe: bool) -> tuple[float, float, int]:
+    pred_ids = [r.get(id_key) for r in res if r.get(id_key)]
+
+    topk = _dedupe_keep_order(pred_ids, k) if dedupe else pred_ids[:k]
+
+    #Recall@k 
+    hit_count = len(set(topk) & gold)
+    recall = hit_count / len(gold)
+
+    #MRR@k
+    rr = 0.0
+    for i, pid in enumerate(topk, start=1):
+        if pid in gold:
+            rr = 1.0 / i
+            break
+    return recall, rr, hit_count
+
+
+def _compact_hit(r: dict) -> dict:
+    # what the checkpoint keeps per hit: enough to recompute doc- and chunk-level metrics
+    return {
+        "rank": r.get("rank"),
+        "score": r.get("score"),
+        "doc_id": r.get("doc_id"),
+        "chunk_id": r.get("chunk_id"),
+    }
+
+
+def read_checkpoint_header(path: Path) -> dict | None:
+    """The {"checkpoint": meta} first row of a checkpoint file (None if absent / legacy)."""
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        first = f.readline().strip()
+    try:
+        row = json.loads(first) if first else {}
+    except json.JSONDecodeError:
+        return None
+    return row.get("checkpoint") if isinstance(row, dict) else None
+
+
+def open_checkpoint(path: Path, meta: dict) -> None:
+    """
+    Make `path` a checkpoint for `meta` (index version, search config, ks): a file written
+    for anything else is discarded with a warning, so a re-run after an index rebuild or
+    a config change searches again instead of reporting stale predictions.
+    """
+    meta = json.loads(json.dumps(meta, default=str))
+    if path.exists():
+        header = read_checkpoint_header(path)
+        if header == meta:
+            return
+        print(f"[warn] checkpoint {path} was written for {header}, not {meta}; starting over")
+        path.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"checkpoint": meta}, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def load_checkpoint(path: Path) -> dict[tuple[str, int], dict]:
+    """(qid, k) -> saved row {qid, k, results, latency_ms}. A torn last line is ignored."""
+    out: dict[tuple[str, int], dict] = {}
+    if not path.exists():
+        return out
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "qid" not in row:
+                continue   # header row
+            out[(row["qid"], int(row["k"]))] = row
+    return out
+
+
+def collect_predictions(
     questions: list[dict],
     *,
     k: int,
     search_fn: SearchFn,
-    id_key: str = "doc_id",           # "doc_id" (doc-level) or "chunk_id" (chunk-level)
-    dedupe: bool = True,            
-    save_fail_path: Path | None = None,
-    label: str = "Evaluating"
+    max_workers: int = 1,
+    checkpoint_path: Path | None = None,
+    checkpoint_meta: dict | None = None,
+    label: str = "Evaluating",
+) -> tuple[dict[str, list[dict]], dict[str, float]]:
+    """
+    (qid -> ranked results from search_fn(query, k), qid -> search latency in ms).
+    - Questions without gold ids are not searched.
+    - max_workers > 1 runs searches on a bounded thread pool.
+    - With checkpoint_path, each finished question is appended (compact hits) and
+      questions already in the checkpoint for this k are not searched again.
+      checkpoint_meta identifies the run (see open_checkpoint); a mismatching file is dropped.
+    """
+    preds: dict[str, list[dict]] = {}
+    latencies: dict[str, float] = {}
+    if checkpoint_path is not None:
+        open_checkpoint(checkpoint_path, checkpoint_meta or {})
+        for (qid, kk), row in load_checkpoint(checkpoint_path).items():
+            if kk == k:
+                preds[qid] = row["results"]
+                if row.get("latency_ms") is not None:
+                    latencies[qid] = float(row["latency_ms"])
+
+    todo = [q for q in questions if q.get("gold_doc_ids") and q["qid"] not in preds]
+
+    lock = threading.Lock()
+    ckpt = None
+    if checkpoint_path is not None:
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        ckpt = checkpoint_path.open("a", encoding="utf-8")
+
+    def run_one(q: dict) -> tuple[str, list[dict], float]:
+        t0 = time.perf_counter()
+        res = search_fn(q["query"], k)
+        ms = (time.perf_counter() - t0) * 1000
+        if ckpt is not None:
+            row = {"qid": q["qid"], "k": k, "results": [_compact_hit(r) for r in res], "latency_ms": round(ms, 3)}
+            with lock:
+                ckpt.write(json.dumps(row, ensure_ascii=False) + "\n")
+                ckpt.flush()
+        return q["qid"], res, ms
+
+    try:
+        if max_workers <= 1:
+            for q in tqdm(todo, desc=f"{label} | k={k}", ncols=100):
+                qid, res, ms = run_one(q)
+                preds[qid] = res
+                latencies[qid] = ms
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as ex:
+                futures = [ex.submit(run_one, q) for q in todo]
+                for fut in tqdm(as_completed(futures), total=len(futures), desc=f"{label} | k={k}", ncols=100):
+                    qid, res, ms = fut.result()
+                    preds[qid] = res
+                    latencies[qid] = ms
+    finally:
+        if ckpt is not None:
+            ckpt.close()
+
+    return preds, latencies
+
+
+def latency_summary(latencies_ms: Iterable[float]) -> dict:
+    x = np.asarray(list(latencies_ms), dtype=np.float64)
+    if not x.size:
+        return {"n": 0, "mean": None, "p50": None, "p90": None, "p99": None}
+    return {
+        "n": int(x.size),
+        "mean": float(x.mean()),
+        "p50": float(np.percentile(x, 50)),
+        "p90": float(np.percentile(x, 90)),
+        "p99": float(np.percentile(x, 99)),
+    }
+
+
+def score_predictions(
+    questions: list[dict],
+    preds: dict[str, list[dict]],
+    *,
+    k: int,
+    id_key: str = "doc_id",
+    dedupe: bool = True,
 ):
+    """Metrics over questions in input order (deterministic regardless of completion order)."""
     recalls: list[float] = []
     mrrs: list[float] = []
     fails: list[dict] = []
     skipped_no_gold = 0
 
-    for q in tqdm(questions, desc=f"{label} | k={k}", ncols=100):
+    for q in questions:
         qid = q["qid"]
         query = q["query"]
         gold = set(q.get("gold_doc_ids", []))  # 현재 질문 포맷 기준
@@ -60,22 +225,9 @@ def evaluate_retrieval(
             skipped_no_gold += 1
             continue
 
-        res = search_fn(query, k)  #Evaluator Cutoff K
-        pred_ids = [r.get(id_key) for r in res if r.get(id_key)]
-
-        topk = _dedupe_keep_order(pred_ids, k) if dedupe else pred_ids[:k]
-
-        #Recall@k 
-        hit_count = len(set(topk) & gold)
-        recall = hit_count / len(gold)
+        res = preds[qid]
+        recall, rr, hit_count = _score_one(res, gold, k=k, id_key=id_key, dedupe=dedupe)
         recalls.append(recall)
-
-        #MRR@k
-        rr = 0.0
-        for i, pid in enumerate(topk, start=1):
-            if pid in gold:
-                rr = 1.0 / i
-                break
         mrrs.append(rr)
 
         if hit_count == 0:
@@ -83,7 +235,7 @@ def evaluate_retrieval(
                 "qid": qid,
                 "query": query,
                 "gold_ids": list(gold),
-                "top5": res[:5],
+                "top5": to_dicts(res[:5]),   # Hit records are not JSON-serializable
             })
 
     metrics = {
@@ -95,6 +247,33 @@ def evaluate_retrieval(
         "mrr_at_k": float(np.mean(mrrs)) if mrrs else 0.0,
         "n_fail": len(fails),
     }
+    return metrics, fails
+
+
+def evaluate_retrieval(
+    questions: list[dict],
+    *,
+    k: int,
+    search_fn: SearchFn,
+    id_key: str = "doc_id",           # "doc_id" (doc-level) or "chunk_id" (chunk-level)
+    dedupe: bool = True,            
+    save_fail_path: Path | None = None,
+    label: str = "Evaluating",
+    max_workers: int = 1,
+    checkpoint_path: Path | None = None,
+    checkpoint_meta: dict | None = None,
+):
+    preds, latencies = collect_predictions(
+        questions,
+        k=k,
+        search_fn=search_fn,
+        max_workers=max_workers,
+        checkpoint_path=checkpoint_path,
+        checkpoint_meta=checkpoint_meta,
+        label=label,
+    )
+    metrics, fails = score_predictions(questions, preds, k=k, id_key=id_key, dedupe=dedupe)
+    metrics["latency_ms"] = latency_summary(latencies.values())
 
     if save_fail_path:
         save_fail_path.parent.mkdir(parents=True, exist_ok=True)
@@ -113,11 +292,24 @@ def run_eval_suite(
     out_path: Path | None = None,
     id_key: str = "doc_id",
     dedupe: bool = True,
-    label: str = "Evaluating"
+    label: str = "Evaluating",
+    max_workers: int = 1,
+    checkpoint_path: Path | None = None,
+    checkpoint_meta: dict | None = None,
+    per_query_latency: bool = True,
+    suite_extra: dict | None = None,
 ):
-    suite = {"ks": list(ks), "results": {}}
+    """
+    checkpoint_meta: index version + search_fn config for the checkpoint header (ks are added).
+    per_query_latency=False leaves latency_ms empty (e.g. batch reranking, where the one
+    batch wait is reported in suite_extra instead); suite_extra is merged into the suite.
+    """
+    suite = {"label": label, "ks": list(ks), "results": {}, **(suite_extra or {})}
+    ckpt_meta = {**(checkpoint_meta or {}), "ks": list(ks)}
+    suite_before = usage_snapshot()
 
     for k in ks:
+        before = usage_snapshot()
         m, _ = evaluate_retrieval(
             questions,
             k=k,
@@ -125,12 +317,137 @@ def run_eval_suite(
             id_key=id_key,
             dedupe=dedupe,
             save_fail_path=None,
-            label=label
+            label=label,
+            max_workers=max_workers,
+            checkpoint_path=checkpoint_path,
+            checkpoint_meta=ckpt_meta,
         )
+        if not per_query_latency:
+            m["latency_ms"] = latency_summary([])
+        m["usage"] = usage_since(before)   # API calls + tokens spent on this k
+        suite["results"][str(k)] = m
+
+    suite["usage"] = usage_since(suite_before)
+
+    if out_path:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text(json.dumps(suite, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    return suite
+
+
+@dataclass(frozen=True)
+class VectorStage:
+    """Stages 1-2 of the pipelined eval, computed once and shared by the suites over it."""
+    lists: dict[str, list[dict]]     # query -> top-`depth` results
+    depth: int
+    group_by: str | None
+    ms_per_query: float
+    usage: Counter                   # charged to every suite that consumes the stage
+
+
+def run_vector_stage(questions: list[dict], *, vs, depth: int, embed_batch=None, group_by: str | None = None) -> VectorStage:
+    """Batched embedding + one batched search for every distinct scored query."""
+    from src.eval.search_wrappers import prefetch_vector_search
+
+    queries = [q["query"] for q in questions if q.get("gold_doc_ids")]
+    t0 = time.perf_counter()
+    with deferred_usage() as used:
+        lists = prefetch_vector_search(vs, queries, k=depth, embed_batch=embed_batch, group_by=group_by)
+    ms = (time.perf_counter() - t0) * 1000 / max(len(lists), 1)
+    return VectorStage(lists=lists, depth=depth, group_by=group_by, ms_per_query=ms, usage=used)
+
+
+def run_pipelined_eval_suite(
+    questions: list[dict],
+    *,
+    vs,
+    ks=(1, 3, 5, 10),
+    embed_batch=None,
+    group_by: str | None = None,
+    rerank: bool = False,
+    k_vec: int = 10,
+    rerank_model: str | None = None,
+    rerank_mode: str | None = None,
+    max_workers: int = 8,
+    out_path: Path | None = None,
+    id_key: str = "doc_id",
+    dedupe: bool = True,
+    expand_aliases: bool = False,
+    vector_stage: VectorStage | None = None,
+    label: str = "Evaluating",
+):
+    """
+    Pipelined counterpart of run_eval_suite (same suite JSON), built from the
+    search_wrappers stages instead of one search_fn call per question per k:
+    1) embed every distinct scored query in batches
+    2) one batched FAISS search at depth max(ks) (k_vec when reranking)
+       (1-2 are reused from vector_stage when given, e.g. shared by the vector and
+       rerank suites; its embedding usage is charged to each suite)
+    3) rerank fanned out over the shortlists (max_workers threads), once per query
+    4) every k scored from prefixes of the same lists (expand_aliases: after listing
+       build-time near-duplicates behind their canonical hit, as for chunk-level eval)
+    latency_ms per query = its share of stages 1-2 + its own rerank call.
+    Every k is served by the same calls, so each k's "usage" is the whole pipeline's.
+    """
+    from src.eval.search_wrappers import make_prefetched_search_fn, prefetch_rerank
+    from src.retrieval.vector_store import expand_alias_hits
+
+    suite = {"label": label, "ks": list(ks), "pipelined": True, "results": {}}
+    before = usage_snapshot()
+    scored = [q for q in questions if q.get("gold_doc_ids")]
+    depth = k_vec if rerank else max(ks)
+
+    if vector_stage is None or vector_stage.depth < depth:
+        vector_stage = run_vector_stage(questions, vs=vs, depth=depth, embed_batch=embed_batch, group_by=group_by)
+    elif vector_stage.group_by != group_by:
+        raise ValueError(f"vector_stage was searched with group_by={vector_stage.group_by!r}, not {group_by!r}")
+    charge_usage(vector_stage.usage)
+    lists = {q: res[:depth] for q, res in vector_stage.lists.items()}
+    shared_ms = vector_stage.ms_per_query
+    rerank_ms: dict[str, float] = {}
+    if rerank:
+        extra = {"mode": rerank_mode} if rerank_mode else {}
+        lists, rerank_ms = prefetch_rerank(lists, rerank_model=rerank_model, max_workers=max_workers, **extra)
+    if expand_aliases:
+        # copies: the stage's hit records are shared with other suites
+        lists = {q: expand_alias_hits([r.copy() for r in res]) for q, res in lists.items()}
+    print(f"[eval] {label}: {len(scored)} questions -> {len(lists)} distinct queries | depth={depth}")
+
+    # rerank lists stop at k_vec for larger k too, as with make_llm_rerank_search_fn
+    search_fn = make_prefetched_search_fn(lists, k_max=max(max(ks), depth))
+    usage = usage_since(before)
+    for k in ks:
+        preds = {q["qid"]: search_fn(q["query"], k) for q in scored}
+        m, _ = score_predictions(questions, preds, k=k, id_key=id_key, dedupe=dedupe)
+        m["latency_ms"] = latency_summary(shared_ms + rerank_ms.get(q["query"].strip(), 0.0) for q in scored)
+        m["usage"] = usage
         suite["results"][str(k)] = m
 
+    suite["usage"] = usage
+
     if out_path:
         out_path.parent.mkdir(parents=True, exist_ok=True)
         out_path.write_text(json.dumps(suite, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    return suite
\ No newline at end of file
+    return suite
+
+
+def recompute_suite_from_checkpoint(
+    questions: list[dict],
+    checkpoint_path: Path,
+    *,
+    ks=(1, 3, 5, 10),
+    id_key: str = "doc_id",
+    dedupe: bool = True,
+):
+    """Offline metrics from saved predictions (no search calls). Raises KeyError if a (qid, k) is missing."""
+    saved = load_checkpoint(checkpoint_path)
+    suite = {"ks": list(ks), "results": {}}
+    for k in ks:
+        rows = {qid: row for (qid, kk), row in saved.items() if kk == k}
+        preds = {qid: row["results"] for qid, row in rows.items()}
+        m, _ = score_predictions(questions, preds, k=k, id_key=id_key, dedupe=dedupe)
+        m["latency_ms"] = latency_summary(r["latency_ms"] for r in rows.values() if r.get("latency_ms") is not None)
+        suite["results"][str(k)] = m
+    return suite
@@ -1,21 +1,21 @@
 # src/eval/retrieval_logging.py
 from __future__ import annotations
 
+from collections import Counter, defaultdict
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Iterator
+import gzip
 import json
+import queue
+import threading
+import time
 
+import numpy as np
 
-def log_retrieval(
-    *,
-    log_path: Path,
-    query: str,
-    results: list[dict],
-    comment: str | None = None,
-) -> None:
-    log_path.parent.mkdir(parents=True, exist_ok=True)
 
-    record = {
+def _make_record(query: str, results: list[dict], comment: str | None) -> dict:
+    return {
         "timestamp": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
         "query": query,
         "top_k": len(results),
@@ -24,8 +24,10 @@ def log_retrieval(
                 "rank": r.get("rank"),
                 "score": r.get("score"),
                 "chunk_id": r.get("chunk_id"),
+                "doc_id": r.get("doc_id"),
                 "source": r.get("source"),
                 "ticker": r.get("ticker"),
+                "company": r.get("company"),
                 "date": r.get("date"),
                 "title": r.get("title"),
             }
@@ -34,5 +36,173 @@ def log_retrieval(
         "comment": comment,
     }
 
+
+def log_retrieval(
+    *,
+    log_path: Path,
+    query: str,
+    results: list[dict],
+    comment: str | None = None,
+) -> None:
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    record = _make_record(query, results, comment)
+
     with log_path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
\ No newline at end of file
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class AsyncRetrievalLogger:
+    """
+    Non-blocking retrieval logger.
+    - log() only enqueues; a background thread writes records in batches.
+    - Bounded queue: when full, the record is dropped (counted in .dropped), never blocks.
+    - Rotation when the file exceeds max_bytes or its first record is older than
+      max_age_s (so restarts do not reset the age): <stem>.<UTC timestamp><suffix>[.gz]
+    """
+
+    def __init__(
+        self,
+        log_path: Path,
+        *,
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        flush_interval_s: float = 1.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_age_s: float | None = 24 * 3600,
+        compress: bool = True,
+    ):
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.compress = compress
+        self.dropped = 0
+        self.written = 0
+
+        self._q: queue.Queue[dict] = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # .dropped is bumped by callers and the writer thread
+        self._opened_at: float | None = None  # start of the live file, read lazily from it
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="retrieval-logger", daemon=True)
+        self._thread.start()
+
+    def log(self, *, query: str, results: list[dict], comment: str | None = None) -> bool:
+        try:
+            self._q.put_nowait(_make_record(query, results, comment))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _drain(self) -> list[dict]:
+        batch: list[dict] = []
+        try:
+            batch.append(self._q.get(timeout=self.flush_interval_s))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._q.empty()):
+            batch = self._drain()
+            if not batch:
+                continue
+            try:
+                self._maybe_rotate()
+                with self.log_path.open("a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+                self.written += len(batch)
+            except Exception as e:
+                # logging must never take the service down
+                with self._lock:
+                    self.dropped += len(batch)
+                print(f"[warn] retrieval log write failed: {e}")
+
+    def _maybe_rotate(self) -> None:
+        p = self.log_path
+        if not p.exists():
+            self._opened_at = None
+            return
+        if self._opened_at is None:
+            self._opened_at = _first_record_time(p) or p.stat().st_mtime
+        too_big = p.stat().st_size >= self.max_bytes
+        too_old = self.max_age_s is not None and time.time() - self._opened_at >= self.max_age_s
+        if not (too_big or too_old):
+            return
+
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        rotated = p.with_name(f"{p.stem}.{stamp}{p.suffix}")
+        p.rename(rotated)
+        if self.compress:
+            with rotated.open("rb") as src, gzip.open(str(rotated) + ".gz", "wb") as dst:
+                dst.writelines(src)
+            rotated.unlink()
+        self._opened_at = None
+
+
+def _first_record_time(path: Path) -> float | None:
+    """Epoch seconds of the first record's timestamp, None if unreadable."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            ts = json.loads(f.readline())["timestamp"]
+        return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+# ---- reader over current + rotated logs ----
+
+def iter_log_records(log_path: Path) -> Iterator[dict]:
+    """Yield records from rotated files (oldest first, .gz included), then the live file."""
+    rotated = sorted(log_path.parent.glob(f"{log_path.stem}.*{log_path.suffix}*"))
+    for p in rotated + ([log_path] if log_path.exists() else []):
+        opener = gzip.open if p.suffix == ".gz" else open
+        with opener(p, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def aggregate_log_stats(log_path: Path) -> dict[str, dict]:
+    """
+    Per "<day>|<ticker>" (ticker falls back to company): number of hits,
+    score percentiles and rank histogram.
+    """
+    scores: dict[str, list[float]] = defaultdict(list)
+    ranks: dict[str, Counter] = defaultdict(Counter)
+
+    for rec in iter_log_records(log_path):
+        day = (rec.get("timestamp") or "")[:10]
+        for r in rec.get("results", []):
+            ticker = r.get("ticker") or r.get("company") or "unknown"
+            key = f"{day}|{ticker}"
+            if r.get("score") is not None:
+                scores[key].append(float(r["score"]))
+            if r.get("rank") is not None:
+                ranks[key][int(r["rank"])] += 1
+
+    out = {}
+    for key in sorted(set(scores) | set(ranks)):
+        s = np.asarray(scores.get(key, []), dtype=np.float32)
+        out[key] = {
+            "n_hits": int(sum(ranks[key].values())),
+            "score_mean": float(s.mean()) if s.size else None,
+            "score_p50": float(np.percentile(s, 50)) if s.size else None,
+            "score_p90": float(np.percentile(s, 90)) if s.size else None,
+            "rank_hist": {str(k): v for k, v in sorted(ranks[key].items())},
+        }
+    return out
@@ -1,13 +1,23 @@
 # src/eval/search_wrappers.py
 from __future__ import annotations
 
-from typing import Callable, List, Dict, Any, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Dict, Any, Optional, Tuple
+import threading
+import time
+
 import numpy as np
 
-from src.retrieval.vector_store import VectorStore, l2_normalize
-from src.llm.rerank import llm_rerank_top1, promote_chosen_to_top
+from src.retrieval.vector_store import VectorStore, expand_alias_hits, l2_normalize
+from src.llm.batch import BatchExecutor, record_body_usage, rerank_requests, submit_batch
+from src.llm.client import charge_usage, deferred_usage
+from src.config import BATCH_SIZE, RERANK_MODE
+from src.llm.rerank import apply_order, llm_rerank_order, parse_mode_order
 
 EmbedQueryFn = Callable[[str], np.ndarray]                 # returns (d,) or (1,d)
+EmbedBatchFn = Callable[[List[str]], np.ndarray]           # n queries -> (n,d)
 SearchFn = Callable[[str, int], List[Dict[str, Any]]]      # query, k -> ranked results
 
 
@@ -23,18 +33,48 @@ def _ensure_2d_float32(v: np.ndarray) -> np.ndarray:
 def make_vectorstore_search_fn(
     vs: VectorStore,
     *,
-    embed_query: EmbedQueryFn,
+    embed_query: Optional[EmbedQueryFn] = None,
     normalize: bool = True,
+    doc_first: bool = False,
+    group_by: Optional[str] = None,
+    expand_aliases: bool = False,
 ) -> SearchFn:
-    """Text query -> embedding -> (optional) normalize -> VectorStore search."""
+    """
+    Text query -> embedding -> (optional) normalize -> VectorStore search.
+    doc_first=True uses the pooled doc index (one result per doc; see VectorStore.search_doc_first).
+    group_by="doc_id" returns k distinct docs via adaptive over-fetch (VectorStore.search_grouped).
+    expand_aliases=True lists near-duplicates collapsed at build time after their canonical
+    hit (chunk-level eval; see make_alias_expanded_search_fn).
+    An index built with a local embedding backend brings its own query embedder, which wins.
+    """
+    embed = getattr(vs, "query_embedder", None) or embed_query
+    if embed is None:
+        raise ValueError("embed_query is required for an API-embedded index.")
+
     def search_fn(query: str, k: int) -> List[Dict[str, Any]]:
         query = (query or "").strip()
         if not query:
             return []
-        qv = _ensure_2d_float32(embed_query(query))
+        qv = _ensure_2d_float32(embed(query))
         if normalize:
             qv = l2_normalize(qv)
+        if doc_first:
+            return vs.search_doc_first(qv, k=k)
+        if group_by:
+            res, _ = vs.search_grouped(qv, k=k, group_key=group_by)
+            return res
         return vs.search_by_vector(qv, k=k)
+    return make_alias_expanded_search_fn(search_fn) if expand_aliases else search_fn
+
+
+def make_alias_expanded_search_fn(base_search_fn: SearchFn) -> SearchFn:
+    """
+    Top-k with build-time near-duplicates expanded: each canonical hit is followed by
+    its aliases (same score, "alias_of" set), cut back to k. Without it a gold chunk
+    that was collapsed into an alias can never be retrieved at chunk level.
+    """
+    def search_fn(query: str, k: int) -> List[Dict[str, Any]]:
+        return expand_alias_hits(list(base_search_fn(query, k)))[:k]
     return search_fn
 
 
@@ -43,24 +83,190 @@ def make_llm_rerank_search_fn(
     *,
     k_vec: int = 10,
     rerank_model: Optional[str] = None,
+    mode: str = RERANK_MODE,
 ) -> SearchFn:
     """
     LLM rerank wrapper.
     - Pick candidate based on base_search_fn(query, k_vec)
-    - Rerank candidate with llm_rerank_top1
+    - Rerank candidates in one call: mode="top1" promotes the LLM pick,
+      mode="listwise" applies the LLM's full ordering
     - Return Final topK
     """
+    extra = {"model": rerank_model} if rerank_model else {}
+
     def search_fn(query: str, k: int) -> List[Dict[str, Any]]:
         candidates = base_search_fn(query, k_vec)
         if not candidates:
             return []
 
-        if rerank_model is None:
-            chosen_i = llm_rerank_top1(query, candidates)
+        order = llm_rerank_order(query, candidates, mode=mode, **extra)
+        reranked = apply_order(candidates, order)
+        return reranked[:k]
+
+    return search_fn
+
+
+def make_batch_rerank_search_fn(
+    base_search_fn: SearchFn,
+    queries: List[str],
+    *,
+    executor: BatchExecutor,
+    work_dir: Path,
+    k_vec: int = 10,
+    rerank_model: Optional[str] = None,
+    mode: str = RERANK_MODE,
+    poll_interval_s: Optional[float] = None,
+) -> SearchFn:
+    """
+    Offline-batch variant of make_llm_rerank_search_fn for eval runs.
+    - Shortlists every (distinct) query now and submits ONE rerank batch file
+    - search_fn.join() waits for the batch (first search_fn call otherwise); results are
+      joined back by custom_id and the wait is kept in search_fn.batch_stats, not in any
+      query's latency
+    - Usage is charged per served query (its shortlist embedding + rerank response),
+      so per-k accounting matches the synchronous wrapper
+    Requests that failed in the batch are reranked synchronously on their shortlist;
+    queries not in `queries` fall back to the synchronous wrapper.
+    """
+    shortlists: Dict[str, List[Dict[str, Any]]] = {}
+    shortlist_usage: Dict[str, Counter] = {}
+    for q in queries:
+        q = (q or "").strip()
+        if q and q not in shortlists:
+            with deferred_usage() as used:
+                shortlists[q] = base_search_fn(q, k_vec)
+            shortlist_usage[q] = used
+
+    items = {f"q{i:06d}": (q, c) for i, (q, c) in enumerate(shortlists.items())}
+    extra = {"model": rerank_model} if rerank_model else {}
+    reqs = rerank_requests(items, mode=mode, **extra)
+    job = submit_batch(reqs, executor=executor, batch_path=work_dir / "rerank_batch.jsonl") if reqs else None
+
+    fallback = make_llm_rerank_search_fn(base_search_fn, k_vec=k_vec, rerank_model=rerank_model, mode=mode)
+    joined: Dict[str, tuple] = {}     # query -> (ordering, response body or None if the request failed)
+    stats: Dict[str, Any] = {"n_requests": len(reqs), "n_failed": 0, "wait_ms": None}
+    lock = threading.Lock()
+
+    def join() -> None:
+        with lock:
+            if stats["wait_ms"] is not None or job is None:
+                return
+            t0 = time.perf_counter()
+            wait_kw = {"poll_interval_s": poll_interval_s} if poll_interval_s is not None else {}
+            bodies, failed = job.wait(**wait_kw)
+            stats["wait_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            stats["n_failed"] = len(failed)
+            for cid, (q, cands) in items.items():
+                if cid in bodies:
+                    text = bodies[cid]["choices"][0]["message"].get("content") or ""
+                    joined[q] = (parse_mode_order(text, cands, mode), bodies[cid])
+                elif cands:
+                    joined[q] = (None, None)
+
+    def search_fn(query: str, k: int) -> List[Dict[str, Any]]:
+        query = (query or "").strip()
+        if query not in shortlists:
+            return fallback(query, k)
+        charge_usage(shortlist_usage[query])
+        cands = shortlists[query]
+        if not cands:
+            return []
+        join()
+        order, body = joined[query]
+        if body is not None:
+            record_body_usage("rerank", body)
         else:
-            chosen_i = llm_rerank_top1(query, candidates, model=rerank_model)
+            order = llm_rerank_order(query, cands, mode=mode, **extra)
+        return apply_order([r.copy() for r in cands], order)[:k]
 
-        reranked = promote_chosen_to_top(candidates, chosen_i)
-        return reranked[:k]
+    search_fn.join = join
+    search_fn.batch_stats = stats
+    return search_fn
+
+
+# ---- prefetch / pipelined stages (see retrieval_eval.run_pipelined_eval_suite) ----
+def _default_embed_batch(vs: VectorStore, batch_size: int) -> EmbedBatchFn:
+    if getattr(vs, "query_embedder", None) is not None:
+        # local backend: no API calls to save, embed row by row in-process
+        return lambda qs: np.vstack([_ensure_2d_float32(vs.query_embedder(q)) for q in qs])
+    from src.llm.embedding import embed_texts
+    return lambda qs: embed_texts(qs, batch_size=batch_size)
+
+
+def prefetch_vector_search(
+    vs: VectorStore,
+    queries: List[str],
+    *,
+    k: int,
+    embed_batch: Optional[EmbedBatchFn] = None,
+    normalize: bool = True,
+    group_by: Optional[str] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Vector stage for many queries at once -> {query: top-k results}.
+    - identical queries (after strip) are embedded and searched once
+    - embeddings come from batched calls (embed_texts) instead of one call per query
+    - one batched FAISS search (VectorStore.search_batch); with group_by at 2k, deepening
+      only the rows still short of k groups (VectorStore.search_grouped_batch)
+    Any k' <= k is served by the prefix of these lists (same as searching with k').
+    """
+    distinct = list(dict.fromkeys(q.strip() for q in queries if (q or "").strip()))
+    if not distinct:
+        return {}
+
+    embed = embed_batch or _default_embed_batch(vs, batch_size)
+    qvs = np.asarray(embed(distinct), dtype=np.float32)
+    if normalize:
+        qvs = l2_normalize(qvs)
+
+    if group_by:
+        results = vs.search_grouped_batch(qvs, k=k, group_key=group_by)
+    else:
+        results = vs.search_batch(qvs, k=k)
+    return dict(zip(distinct, results))
 
-    return search_fn
\ No newline at end of file
+
+def prefetch_rerank(
+    shortlists: Dict[str, List[Dict[str, Any]]],
+    *,
+    rerank_model: Optional[str] = None,
+    mode: str = RERANK_MODE,
+    max_workers: int = 8,
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, float]]:
+    """
+    Rerank stage fanned out over prefetched shortlists on a thread pool (one call per
+    distinct query, whatever the number of ks) -> ({query: reranked}, {query: ms}).
+    """
+    extra = {"model": rerank_model} if rerank_model else {}
+
+    def run_one(item: Tuple[str, List[Dict[str, Any]]]) -> Tuple[str, List[Dict[str, Any]], float]:
+        query, cands = item
+        cands = [r.copy() for r in cands]     # apply_order rewrites rank; keep the vector lists intact
+        t0 = time.perf_counter()
+        reranked = apply_order(cands, llm_rerank_order(query, cands, mode=mode, **extra)) if cands else []
+        return query, reranked, (time.perf_counter() - t0) * 1000
+
+    reranked, latencies = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        for query, res, ms in ex.map(run_one, shortlists.items()):
+            reranked[query] = res
+            latencies[query] = ms
+    return reranked, latencies
+
+
+def make_prefetched_search_fn(
+    prefetched: Dict[str, List[Dict[str, Any]]],
+    *,
+    k_max: int,
+    fallback: Optional[SearchFn] = None,
+) -> SearchFn:
+    """SearchFn over prefetched lists (prefix for k <= k_max); other calls go to `fallback`."""
+    def search_fn(query: str, k: int) -> List[Dict[str, Any]]:
+        query = (query or "").strip()
+        if k <= k_max and query in prefetched:
+            return prefetched[query][:k]
+        if fallback is None:
+            raise KeyError(f"Not prefetched (k={k}, k_max={k_max}): {query!r}")
+        return fallback(query, k)
+    return search_fn
@@ -0,0 +1,282 @@
+# src/llm/batch.py
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Protocol
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from src.config import (
+    BATCH_COMPLETION_WINDOW, BATCH_POLL_INTERVAL_S, BATCH_SIZE, EMBED_MODEL, EMBED_TIMEOUT_S,
+    RERANK_MODE, RERANK_MODEL, RERANK_TIMEOUT_S,
+)
+from src.llm.client import create_chat_completion, create_embeddings, get_client, record_usage
+from src.llm.rerank import build_mode_messages
+
+EMBEDDINGS_URL = "/v1/embeddings"
+CHAT_URL = "/v1/chat/completions"
+
+# url, request body -> response body (same JSON shape as the HTTP API)
+RequestHandler = Callable[[str, dict], dict]
+
+
+# ---- batch file (OpenAI Batch API JSONL format) ----
+def batch_request(custom_id: str, url: str, body: dict) -> dict:
+    return {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+
+
+def write_batch_file(path: Path, requests: list[dict]) -> None:
+    ids = [r["custom_id"] for r in requests]
+    if len(set(ids)) != len(ids):
+        raise ValueError("custom_id must be unique within a batch file.")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        for r in requests:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def _parse_output_lines(text: str) -> list[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# ---- executors ----
+class BatchExecutor(Protocol):
+    def submit(self, batch_path: Path, *, endpoint: str) -> str: ...
+    def status(self, job_id: str) -> str: ...     # "in_progress" | "completed" | "failed"
+    def results(self, job_id: str) -> list[dict]: ...
+
+
+def _api_handler(url: str, body: dict) -> dict:
+    if url == EMBEDDINGS_URL:
+        return create_embeddings(**body, timeout_s=EMBED_TIMEOUT_S).model_dump()
+    if url == CHAT_URL:
+        return create_chat_completion("rerank", **body, timeout_s=RERANK_TIMEOUT_S).model_dump()
+    raise ValueError(f"Unsupported batch url: {url}")
+
+
+class LocalBatchExecutor:
+    """
+    Stand-in for a provider batch endpoint: runs the file's requests on a background
+    thread (through `handler`, default: the synchronous API) and writes an output
+    JSONL next to the input in the provider's result format.
+    """
+
+    def __init__(self, handler: RequestHandler | None = None, *, max_workers: int = 4):
+        self.handler = handler or _api_handler
+        self.max_workers = max_workers
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, batch_path: Path, *, endpoint: str) -> str:
+        job_id = f"local-{uuid.uuid4().hex[:12]}"
+        out_path = batch_path.with_name(batch_path.stem + ".output.jsonl")
+        with self._lock:
+            self._jobs[job_id] = {"status": "in_progress", "out_path": out_path}
+        threading.Thread(target=self._run, args=(job_id, batch_path, out_path), daemon=True).start()
+        return job_id
+
+    def _one(self, req: dict) -> dict:
+        try:
+            body = self.handler(req["url"], req["body"])
+            return {"custom_id": req["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"custom_id": req["custom_id"], "response": None, "error": {"message": str(e)}}
+
+    def _run(self, job_id: str, batch_path: Path, out_path: Path) -> None:
+        try:
+            reqs = _parse_output_lines(batch_path.read_text(encoding="utf-8"))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                rows = list(ex.map(self._one, reqs))
+            with out_path.open("w", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            state = "completed"
+        except Exception as e:
+            print(f"[warn] local batch {job_id} failed: {e}")
+            state = "failed"
+        with self._lock:
+            self._jobs[job_id]["status"] = state
+
+    def status(self, job_id: str) -> str:
+        with self._lock:
+            return self._jobs[job_id]["status"]
+
+    def results(self, job_id: str) -> list[dict]:
+        with self._lock:
+            out_path = self._jobs[job_id]["out_path"]
+        return _parse_output_lines(out_path.read_text(encoding="utf-8"))
+
+
+class OpenAIBatchExecutor:
+    """Provider Batch API: upload the file, create a batch, download output + error files."""
+
+    _FAILED = {"failed", "expired", "cancelled", "cancelling"}
+
+    def __init__(self, completion_window: str = BATCH_COMPLETION_WINDOW):
+        self.completion_window = completion_window
+
+    def submit(self, batch_path: Path, *, endpoint: str) -> str:
+        client = get_client()
+        with batch_path.open("rb") as f:
+            file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=file.id, endpoint=endpoint, completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        s = get_client().batches.retrieve(job_id).status
+        if s == "completed":
+            return "completed"
+        return "failed" if s in self._FAILED else "in_progress"
+
+    def results(self, job_id: str) -> list[dict]:
+        client = get_client()
+        batch = client.batches.retrieve(job_id)
+        rows = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                rows.extend(_parse_output_lines(client.files.content(file_id).text))
+        return rows
+
+
+# ---- submit / poll / join ----
+@dataclass
+class BatchJob:
+    """Handle for a submitted batch file; wait() joins results back by custom_id."""
+    job_id: str
+    executor: BatchExecutor
+    batch_path: Path
+    custom_ids: list[str]
+
+    def done(self) -> bool:
+        return self.executor.status(self.job_id) != "in_progress"
+
+    def wait(
+        self,
+        *,
+        poll_interval_s: float = BATCH_POLL_INTERVAL_S,
+        timeout_s: float | None = None,
+    ) -> tuple[dict[str, dict], dict[str, object]]:
+        """
+        Block until the job finishes -> ({custom_id: response body}, {custom_id: error})
+        for the requests that succeeded / failed (missing rows count as failed), so callers
+        can fall back per request. Raises only if the job itself failed.
+        """
+        t0 = time.monotonic()
+        while (state := self.executor.status(self.job_id)) == "in_progress":
+            if timeout_s is not None and time.monotonic() - t0 > timeout_s:
+                raise TimeoutError(f"Batch {self.job_id} not finished after {timeout_s:.0f}s.")
+            time.sleep(poll_interval_s)
+        if state != "completed":
+            raise RuntimeError(f"Batch {self.job_id} ended with status {state!r}.")
+
+        bodies, errors = {}, {}
+        for row in self.executor.results(self.job_id):
+            resp = row.get("response") or {}
+            if row.get("error") or resp.get("status_code") != 200:
+                errors[row["custom_id"]] = row.get("error") or resp.get("body")
+            else:
+                bodies[row["custom_id"]] = resp["body"]
+
+        failed = {cid: errors.get(cid, "missing from batch output") for cid in self.custom_ids if cid not in bodies}
+        if failed:
+            print(f"[warn] batch {self.job_id}: {len(failed)}/{len(self.custom_ids)} requests failed, "
+                  f"e.g. {dict(list(failed.items())[:3])}")
+        return {cid: bodies[cid] for cid in self.custom_ids if cid in bodies}, failed
+
+
+def submit_batch(requests: list[dict], *, executor: BatchExecutor, batch_path: Path) -> BatchJob:
+    """Write the JSONL batch file and hand it to the executor (non-blocking)."""
+    if not requests:
+        raise ValueError("Empty batch.")
+    urls = {r["url"] for r in requests}
+    if len(urls) != 1:
+        raise ValueError(f"A batch file targets one endpoint, got {sorted(urls)}")
+    write_batch_file(batch_path, requests)
+    job_id = executor.submit(batch_path, endpoint=urls.pop())
+    print(f"[batch] submitted {len(requests)} requests -> {job_id} ({batch_path.name})")
+    return BatchJob(job_id=job_id, executor=executor, batch_path=batch_path,
+                    custom_ids=[r["custom_id"] for r in requests])
+
+
+def record_body_usage(kind: str, body: dict) -> None:
+    record_usage(kind, SimpleNamespace(**(body.get("usage") or {})))
+
+
+# ---- embeddings ----
+def embedding_requests(
+    texts: list[str],
+    *,
+    model: str = EMBED_MODEL,
+    batch_size: int = BATCH_SIZE,
+    dimensions: int | None = None,
+) -> list[dict]:
+    extra = {"dimensions": dimensions} if dimensions else {}
+    return [
+        batch_request(f"emb-{start:08d}", EMBEDDINGS_URL, {"model": model, "input": texts[start:start + batch_size], **extra})
+        for start in range(0, len(texts), batch_size)
+    ]
+
+
+def join_embeddings(bodies: dict[str, dict]) -> np.ndarray:
+    """Embedding response bodies keyed by custom_id -> (n,d), in input order."""
+    vecs = []
+    for cid in sorted(bodies):
+        record_body_usage("embedding", bodies[cid])
+        vecs.extend(d["embedding"] for d in sorted(bodies[cid]["data"], key=lambda d: d["index"]))
+    return np.array(vecs, dtype=np.float32)
+
+
+def embed_texts_batch(
+    texts: list[str],
+    *,
+    executor: BatchExecutor,
+    work_dir: Path,
+    model: str = EMBED_MODEL,
+    batch_size: int = BATCH_SIZE,
+    dimensions: int | None = None,
+    poll_interval_s: float = BATCH_POLL_INTERVAL_S,
+) -> np.ndarray:
+    """Batch-file counterpart of embed_texts (same output)."""
+    if not texts:
+        raise ValueError("Empty text_list passed to embed_texts_batch.")
+    reqs = embedding_requests(texts, model=model, batch_size=batch_size, dimensions=dimensions)
+    job = submit_batch(reqs, executor=executor, batch_path=work_dir / f"embed-{time.time_ns()}.jsonl")
+    bodies, failed = job.wait(poll_interval_s=poll_interval_s)
+    if failed:
+        # every row is needed for the index: no partial result
+        raise RuntimeError(f"Batch {job.job_id}: {len(failed)}/{len(reqs)} embedding requests failed.")
+    vecs = join_embeddings(bodies)
+    if len(vecs) != len(texts):
+        raise RuntimeError(f"Batch returned {len(vecs)} embeddings for {len(texts)} texts.")
+    return vecs
+
+
+# ---- rerank ----
+def rerank_requests(
+    items: dict[str, tuple[str, list[dict]]],
+    *,
+    model: str = RERANK_MODEL,
+    mode: str = RERANK_MODE,
+) -> list[dict]:
+    """items: {custom_id: (query, candidates)} -> one llm_rerank_order-equivalent request each."""
+    return [
+        batch_request(cid, CHAT_URL, {"model": model, "messages": build_mode_messages(q, cands, mode), "temperature": 0})
+        for cid, (q, cands) in items.items() if cands
+    ]
+
+
+def make_executor(name: str) -> BatchExecutor:
+    if name == "local":
+        return LocalBatchExecutor()
+    if name == "openai":
+        return OpenAIBatchExecutor()
+    raise ValueError(f"Unknown batch executor: {name}")
@@ -0,0 +1,296 @@
+# src/llm/client.py
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Iterator, TypeVar
+
+from src.config import (
+    BREAKER_COOLDOWN_S, BREAKER_FAILURE_THRESHOLD, GEN_TIMEOUT_S, MODEL_POOL_MAX_CONNECTIONS,
+    RETRY_BASE_DELAY_S, RETRY_BUDGET_MIN, RETRY_BUDGET_RATIO, RETRY_MAX_ATTEMPTS, RETRY_MAX_DELAY_S,
+)
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=1)
+def get_client() -> "OpenAI":
+    """
+    Shared OpenAI client, created on first use (importing openai is slow).
+    One pooled HTTP connection pool for every caller; SDK retries are off because
+    call_model() owns the retry policy.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY is not set.")
+    import httpx
+    from openai import OpenAI
+    limits = httpx.Limits(max_connections=MODEL_POOL_MAX_CONNECTIONS, max_keepalive_connections=MODEL_POOL_MAX_CONNECTIONS)
+    return OpenAI(max_retries=0, timeout=GEN_TIMEOUT_S, http_client=httpx.Client(limits=limits))
+
+
+# ---- usage accounting (tokens / calls captured from API responses) ----
+_USAGE_LOCK = threading.Lock()
+_USAGE: Counter = Counter()
+_DEFERRED = threading.local()
+
+
+def record_usage(kind: str, usage) -> None:
+    """kind: "embedding" | "rerank" | "generate"; usage: the response's .usage (may be None)."""
+    deferred = getattr(_DEFERRED, "counter", None)
+    with _USAGE_LOCK:
+        target = deferred if deferred is not None else _USAGE
+        target[f"{kind}_calls"] += 1
+        target[f"{kind}_prompt_tokens"] += int(getattr(usage, "prompt_tokens", 0) or 0)
+        target[f"{kind}_completion_tokens"] += int(getattr(usage, "completion_tokens", 0) or 0)
+
+
+@contextmanager
+def deferred_usage() -> Iterator[Counter]:
+    """
+    Usage recorded on this thread inside the block goes to the yielded Counter instead
+    of the global totals; charge_usage() books it later (e.g. when the work is served).
+    """
+    counter: Counter = Counter()
+    prev, _DEFERRED.counter = getattr(_DEFERRED, "counter", None), counter
+    try:
+        yield counter
+    finally:
+        _DEFERRED.counter = prev
+
+
+def charge_usage(counts: Counter) -> None:
+    with _USAGE_LOCK:
+        _USAGE.update(counts)
+
+
+def usage_snapshot() -> dict[str, int]:
+    with _USAGE_LOCK:
+        return dict(_USAGE)
+
+
+def usage_since(before: dict[str, int]) -> dict[str, int]:
+    """Counters accumulated since `before` (a usage_snapshot()), plus LLM / token totals."""
+    now = usage_snapshot()
+    d = {k: now.get(k, 0) - before.get(k, 0) for k in set(now) | set(before)}
+    d = {k: v for k, v in d.items() if v}
+    d["llm_calls"] = d.get("rerank_calls", 0) + d.get("generate_calls", 0)
+    d["embedding_calls"] = d.get("embedding_calls", 0)
+    d["prompt_tokens"] = sum(v for k, v in d.items() if k.endswith("_prompt_tokens"))
+    d["completion_tokens"] = sum(v for k, v in d.items() if k.endswith("_completion_tokens"))
+    return dict(sorted(d.items()))
+
+
+# ---- resilience: retry budget, circuit breaker, deadlines, hedging ----
+class ModelCallError(RuntimeError):
+    """A model call failed after retries, or ran out of deadline / retry budget."""
+
+
+class CircuitOpenError(ModelCallError):
+    """The circuit for this call kind is open; the call was not sent."""
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all call kinds: each call deposits `ratio` tokens, each
+    retry or hedge spends one. Under a widespread outage retries stay a small
+    fraction of traffic instead of multiplying it.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_tokens: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.max_tokens = float(min_tokens)
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def on_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> one half-open probe after `cooldown_s`."""
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"       # let exactly one probe through
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state, self._failures = "closed", 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                self.state, self._opened_at = "open", time.monotonic()
+
+
+_BUDGET = RetryBudget()
+_BREAKERS: dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+_STATS: Counter = Counter()
+_STATS_LOCK = threading.Lock()
+
+
+def _breaker(kind: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        return _BREAKERS.setdefault(kind, CircuitBreaker())
+
+
+def resilience_stats() -> dict:
+    """Retries, hedges (and how often the duplicate won), budget / breaker rejections."""
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    stats["breakers"] = {k: b.state for k, b in _BREAKERS.items()}
+    return stats
+
+
+def _bump(key: str) -> None:
+    with _STATS_LOCK:
+        _STATS[key] += 1
+
+
+def _is_retryable(e: Exception) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx; other 4xx are caller errors."""
+    if isinstance(e, (TimeoutError, FutureTimeout, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _hedged(fn: Callable[[float], T], timeout_s: float, hedge_after_s: float) -> T:
+    """Run fn; if it is still pending after hedge_after_s, race a duplicate and take the first success."""
+    started = threading.Event()
+
+    def attempt(t: float) -> T:
+        started.set()
+        return fn(t)
+
+    first = _HEDGE_POOL.submit(attempt, timeout_s)
+    # the hedge timer runs from when the attempt starts: time spent queued for a pool
+    # thread is local contention, not upstream latency, and must not trigger duplicates
+    started.wait()
+    try:
+        return first.result(timeout=hedge_after_s)
+    except FutureTimeout:
+        pass
+    if not _BUDGET.try_spend():
+        return first.result()
+    _bump("hedges")
+    second = _HEDGE_POOL.submit(fn, max(timeout_s - hedge_after_s, 0.1))
+
+    pending, error = {first, second}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                if f is second:
+                    _bump("hedge_wins")
+                return f.result()
+            error = f.exception()
+    raise error
+
+
+def call_model(
+    kind: str,
+    fn: Callable[[float], T],
+    *,
+    timeout_s: float,
+    deadline_s: float | None = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    hedge_after_s: float | None = None,
+) -> T:
+    """
+    fn(timeout) performs ONE request that must give up after `timeout` seconds.
+    - attempts get min(timeout_s, time left until the deadline); deadline defaults to
+      timeout_s * max_attempts, so one slow upstream call cannot hang the caller
+    - retryable errors back off with full jitter, while the shared retry budget allows
+    - a per-kind circuit breaker fails fast (CircuitOpenError) while the upstream is down
+    - hedge_after_s: duplicate a still-pending attempt (latency-critical calls only)
+    """
+    breaker = _breaker(kind)
+    deadline = time.monotonic() + (deadline_s if deadline_s is not None else timeout_s * max_attempts)
+    _BUDGET.on_call()
+
+    last: Exception | None = None
+    attempt = 0
+    while attempt < max_attempts:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not breaker.allow():
+            _bump("breaker_rejects")
+            raise CircuitOpenError(f"{kind}: circuit open, not calling upstream") from last
+        attempt += 1
+        try:
+            t = min(timeout_s, remaining)
+            resp = _hedged(fn, t, hedge_after_s) if hedge_after_s else fn(t)
+        except Exception as e:
+            if not _is_retryable(e):
+                breaker.record_success()    # upstream answered; the request itself is bad
+                raise
+            breaker.record_failure()
+            last = e
+            if attempt >= max_attempts:
+                break
+            if not _BUDGET.try_spend():
+                _bump("budget_exhausted")
+                print(f"[warn] {kind} call failed, retry budget exhausted: {e!r}")
+                break
+            wait_s = min(random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** (attempt - 1))),
+                         max(deadline - time.monotonic(), 0.0))
+            _bump("retries")
+            print(f"[warn] {kind} call failed ({attempt}/{max_attempts}): {e!r} | retry in {wait_s:.2f}s")
+            time.sleep(wait_s)
+            continue
+        breaker.record_success()
+        return resp
+
+    raise ModelCallError(f"{kind} call failed after {attempt} attempt(s)") from last
+
+
+def create_embeddings(
+    *,
+    timeout_s: float,
+    hedge_after_s: float | None = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    **body: Any,
+):
+    return call_model("embedding", lambda t: get_client().embeddings.create(**body, timeout=t),
+                      timeout_s=timeout_s, hedge_after_s=hedge_after_s, max_attempts=max_attempts)
+
+
+def create_chat_completion(kind: str, *, timeout_s: float, **body: Any):
+    return call_model(kind, lambda t: get_client().chat.completions.create(**body, timeout=t), timeout_s=timeout_s)
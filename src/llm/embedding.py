@@ -1,22 +1,21 @@
 # src/llm/embedding.py
 from __future__ import annotations
 
-import os
-import time
-import random
 from typing import List
 
 import numpy as np
-from tqdm import tqdm
-from openai import OpenAI
 
-from src.config import EMBED_MODEL, BATCH_SIZE
+from src.config import EMBED_MODEL, BATCH_SIZE, EMBED_TIMEOUT_S, QUERY_EMBED_HEDGE_AFTER_S, QUERY_EMBED_TIMEOUT_S
+from src.llm.client import create_embeddings, record_usage
+from src.llm.local_embedding import is_local_model
 
 
-def _get_client() -> OpenAI:
-    if not os.getenv("OPENAI_API_KEY"):
-        raise RuntimeError("OPENAI_API_KEY is not set.")
-    return OpenAI()
+def _check_api_model(model: str) -> None:
+    if is_local_model(model):
+        raise ValueError(
+            f"{model} is fitted per index at build time; use VectorStore.query_embedder "
+            "(loaded from lsa_model.npz) instead of the API embedding functions."
+        )
 
 
 def embed_texts(
@@ -24,37 +23,35 @@ def embed_texts(
     model: str = EMBED_MODEL,
     batch_size: int = BATCH_SIZE,
     max_retries: int = 5,
+    dimensions: int | None = None,
 ) -> np.ndarray:
     if not text_list:
         raise ValueError("Empty text_list passed to embed_texts.")
+    _check_api_model(model)
+
+    from tqdm import tqdm
 
-    client = _get_client()
     all_vecs = []
+    extra = {"dimensions": dimensions} if dimensions else {}
 
     for start in tqdm(range(0, len(text_list), batch_size), desc="Embedding"):
         batch = text_list[start:start + batch_size]
-
-        for attempt in range(max_retries):
-            try:
-                resp = client.embeddings.create(model=model, input=batch)
-                all_vecs.extend([d.embedding for d in resp.data])
-                break
-            except Exception as e:
-                wait = (2 ** attempt) + random.random()
-                print(f"[warn] embedding batch failed ({attempt+1}/{max_retries}): {e}")
-                print(f"       sleeping {wait:.2f}s...")
-                time.sleep(wait)
-        else:
-            raise RuntimeError("Embedding failed after max retries.")
+        resp = create_embeddings(model=model, input=batch, timeout_s=EMBED_TIMEOUT_S, max_attempts=max_retries, **extra)
+        record_usage("embedding", resp.usage)
+        all_vecs.extend([d.embedding for d in resp.data])
 
     return np.array(all_vecs, dtype=np.float32)
 
 
-def embed_query(query: str, model: str = EMBED_MODEL) -> np.ndarray:
+def embed_query(query: str, model: str = EMBED_MODEL, dimensions: int | None = None) -> np.ndarray:
     query = query.strip()
     if not query:
         raise ValueError("Empty query.")
+    _check_api_model(model)
 
-    client = _get_client()
-    resp = client.embeddings.create(model=model, input=[query])
+    extra = {"dimensions": dimensions} if dimensions else {}
+    # latency-critical: short deadline + a hedged duplicate if the first request stalls
+    resp = create_embeddings(model=model, input=[query], timeout_s=QUERY_EMBED_TIMEOUT_S,
+                             hedge_after_s=QUERY_EMBED_HEDGE_AFTER_S, **extra)
+    record_usage("embedding", resp.usage)
     return np.array(resp.data[0].embedding, dtype=np.float32)[None, :]
\ No newline at end of file
@@ -0,0 +1,73 @@
+# src/llm/embedding_cache.py
+from __future__ import annotations
+
+from pathlib import Path
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+from src.config import BATCH_SIZE, EMBED_MODEL
+from src.llm.embedding import embed_texts
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-hash keyed embedding cache for one model, persisted as part-*.npz files
+    (keys + vectors) under cache_dir/<model>/. Identical texts are embedded once,
+    across index builds, chunking variants and processes.
+    """
+
+    def __init__(self, cache_dir: Path, model: str = EMBED_MODEL):
+        self.model = model
+        self.dir = cache_dir / re.sub(r"[^0-9a-zA-Z._-]+", "_", model)
+        self.hits = 0
+        self.misses = 0
+        self._vecs: dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        for p in sorted(self.dir.glob("part-*.npz")):
+            with np.load(p, allow_pickle=False) as z:
+                for k, v in zip(z["keys"], z["vecs"]):
+                    self._vecs[str(k)] = v
+
+    def __len__(self) -> int:
+        return len(self._vecs)
+
+    def __contains__(self, text: str) -> bool:
+        return text_key(text) in self._vecs
+
+    def embed(self, texts: list[str], *, batch_size: int = BATCH_SIZE) -> np.ndarray:
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            missing = {k: t for k, t in zip(keys, texts) if k not in self._vecs}
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        if missing:
+            new_keys = list(missing)
+            vecs = embed_texts([missing[k] for k in new_keys], model=self.model, batch_size=batch_size)
+            self._add(new_keys, np.asarray(vecs, dtype=np.float32))
+
+        with self._lock:
+            return np.stack([self._vecs[k] for k in keys]).astype(np.float32)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        query = query.strip()
+        if not query:
+            raise ValueError("Empty query.")
+        return self.embed([query])
+
+    def _add(self, keys: list[str], vecs: np.ndarray) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        part = self.dir / f"part-{time.time_ns()}-{threading.get_ident()}.npz"
+        with part.open("wb") as f:
+            np.savez(f, keys=np.array(keys), vecs=vecs)
+        with self._lock:
+            for k, v in zip(keys, vecs):
+                self._vecs[k] = v
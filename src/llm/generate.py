@@ -1,10 +1,9 @@
 # src/llm/generate.py
 from __future__ import annotations
 import re
-from openai import OpenAI
-from src.config import GEN_MODEL
+from src.config import GEN_MODEL, GEN_TIMEOUT_S
+from src.llm.client import create_chat_completion, record_usage
 
-client = OpenAI()
 
 def extract_cited_doc_ids(text: str) -> set[str]:
     return set(re.findall(r"\[([^\]]+)\]", text or ""))
@@ -29,12 +28,15 @@ def rag_generate(query: str, context: str, model: str = GEN_MODEL) -> str:
     )
     user = f"CONTEXT:\n{context}\n\nQUESTION:\n{query}\n\nANSWER:"
 
-    resp = client.chat.completions.create(
+    resp = create_chat_completion(
+        "generate",
         model=model,
         messages=[{"role": "system", "content": system},
                   {"role": "user", "content": user}],
-        temperature=0
+        temperature=0,
+        timeout_s=GEN_TIMEOUT_S,
     )
+    record_usage("generate", resp.usage)
     return (resp.choices[0].message.content or "").strip()
 
 def rag_generate_with_retry(query: str, context: str, retrieved: list[dict], model: str = GEN_MODEL) -> tuple[str, bool]:
@@ -51,12 +53,15 @@ def rag_generate_with_retry(query: str, context: str, retrieved: list[dict], mod
         "Return an answer with correct [doc_id] citations."
     )
     user2 = f"CONTEXT:\n{context}\n\nQUESTION:\n{query}\n\nANSWER:"
-    resp = client.chat.completions.create(
+    resp = create_chat_completion(
+        "generate",
         model=model,
         messages=[{"role":"system","content":system2},
                   {"role":"user","content":user2}],
-        temperature=0
+        temperature=0,
+        timeout_s=GEN_TIMEOUT_S,
     )
+    record_usage("generate", resp.usage)
     ans2 = (resp.choices[0].message.content or "").strip()
     ok2 = validate_citations(ans2, retrieved)
     return ans2, ok2
\ No newline at end of file
@@ -0,0 +1,155 @@
+# src/llm/local_embedding.py
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+import re
+
+import numpy as np
+
+LOCAL_MODEL_PREFIX = "local-lsa"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.'\-][a-z0-9]+)*")
+
+
+def is_local_model(model: str) -> bool:
+    return (model or "").startswith(LOCAL_MODEL_PREFIX)
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+# ---- minimal CSR (numpy only) for vectorized sparse @ dense ----
+
+@dataclass(frozen=True)
+class _Csr:
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    shape: tuple[int, int]
+
+    def dot(self, m: np.ndarray) -> np.ndarray:
+        """self (n, V) @ m (V, r) -> (n, r)."""
+        out = np.zeros((self.shape[0], m.shape[1]), dtype=np.float32)
+        rows = np.flatnonzero(np.diff(self.indptr))
+        if rows.size:
+            prod = self.data[:, None] * m[self.indices]
+            # segments between consecutive non-empty row starts are exactly one row each
+            out[rows] = np.add.reduceat(prod, self.indptr[rows], axis=0)
+        return out
+
+    def transpose(self) -> "_Csr":
+        n, v = self.shape
+        row_of = np.repeat(np.arange(n), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(self.indices, minlength=v))])
+        return _Csr(indptr=indptr, indices=row_of[order], data=self.data[order], shape=(v, n))
+
+
+@dataclass
+class LsaEmbedder:
+    """
+    TF-IDF (sublinear tf, smooth idf, L2 rows) + truncated SVD (LSA).
+    Fitted on chunks at build time, persisted as NumPy arrays next to the index,
+    applied to queries with one sparse @ dense product (no network call).
+    """
+    vocab: dict[str, int]
+    idf: np.ndarray            # (V,)
+    components: np.ndarray     # (dim, V)
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[0])
+
+    # ---- fit / transform ----
+    @classmethod
+    def fit(
+        cls,
+        texts: list[str],
+        *,
+        dim: int = 256,
+        min_df: int = 2,
+        max_features: int = 50_000,
+        n_iter: int = 4,
+        seed: int = 0,
+    ) -> "LsaEmbedder":
+        docs = [_tokenize(t) for t in texts]
+        df = Counter()
+        for toks in docs:
+            df.update(set(toks))
+
+        terms = sorted((t for t, c in df.items() if c >= min_df), key=lambda t: (-df[t], t))[:max_features]
+        if not terms:
+            raise ValueError("Empty vocabulary for LSA (lower min_df or check texts).")
+        vocab = {t: i for i, t in enumerate(sorted(terms))}
+        n = len(docs)
+        dfv = np.array([df[t] for t in sorted(terms)], dtype=np.float32)
+        idf = (np.log((1 + n) / (1 + dfv)) + 1.0).astype(np.float32)
+
+        x = _tfidf(docs, vocab, idf)
+        components = _randomized_svd_components(x, dim=dim, n_iter=n_iter, seed=seed)
+        return cls(vocab=vocab, idf=idf, components=components)
+
+    def transform(self, texts: list[str]) -> np.ndarray:
+        x = _tfidf([_tokenize(t) for t in texts], self.vocab, self.idf)
+        return x.dot(np.ascontiguousarray(self.components.T))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        query = query.strip()
+        if not query:
+            raise ValueError("Empty query.")
+        return self.transform([query])
+
+    # ---- persistence ----
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        terms = np.array(sorted(self.vocab, key=self.vocab.get))
+        with path.open("wb") as f:
+            np.savez(f, vocab=terms, idf=self.idf, components=self.components)
+
+    @classmethod
+    def load(cls, path: Path) -> "LsaEmbedder":
+        with np.load(path, allow_pickle=False) as z:
+            vocab = {str(t): i for i, t in enumerate(z["vocab"])}
+            return cls(vocab=vocab, idf=z["idf"], components=z["components"])
+
+
+def _tfidf(docs: list[list[str]], vocab: dict[str, int], idf: np.ndarray) -> _Csr:
+    indptr, indices, data = [0], [], []
+    for toks in docs:
+        tf = Counter(vocab[t] for t in toks if t in vocab)
+        cols = sorted(tf)
+        vals = np.array([1.0 + np.log(tf[c]) for c in cols], dtype=np.float32) * idf[cols] if cols else np.empty(0, np.float32)
+        norm = float(np.linalg.norm(vals))
+        if norm > 0:
+            vals = vals / norm
+        indices.extend(cols)
+        data.extend(vals.tolist())
+        indptr.append(len(indices))
+    return _Csr(
+        indptr=np.asarray(indptr, dtype=np.int64),
+        indices=np.asarray(indices, dtype=np.int64),
+        data=np.asarray(data, dtype=np.float32),
+        shape=(len(docs), len(vocab)),
+    )
+
+
+def _randomized_svd_components(x: _Csr, *, dim: int, n_iter: int, seed: int, oversample: int = 10) -> np.ndarray:
+    """Top-`dim` right singular vectors of x (Halko et al. randomized range finder)."""
+    n, v = x.shape
+    dim = min(dim, n, v)
+    rank = min(dim + oversample, n, v)
+    xt = x.transpose()
+
+    rng = np.random.default_rng(seed)
+    q = x.dot(rng.standard_normal((v, rank)).astype(np.float32))
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(q)
+        z, _ = np.linalg.qr(xt.dot(q))
+        q = x.dot(z)
+    q, _ = np.linalg.qr(q)
+
+    b = xt.dot(q).T                       # (rank, V)
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return np.ascontiguousarray(vt[:dim], dtype=np.float32)
@@ -3,10 +3,9 @@ from __future__ import annotations
 
 import json
 import re
-from openai import OpenAI
-from src.config import RERANK_MODEL
+from src.config import RERANK_MODEL, RERANK_MODE, RERANK_TIMEOUT_S, RERANK_EXCERPT_TOKENS
+from src.llm.client import create_chat_completion, record_usage
 
-client = OpenAI()
 
 def _compact_candidate(r: dict) -> dict:
     return {
@@ -20,13 +19,7 @@ def _compact_candidate(r: dict) -> dict:
         "text": (r.get("text_preview") or r.get("text") or "")[:600],
     }
 
-def llm_rerank_top1(query: str, candidates: list[dict], model: str = RERANK_MODEL) -> int:
-    """
-    Returns: chosen_index (0-based) among candidates
-    """
-    if not candidates:
-        return 0
-
+def build_rerank_messages(query: str, candidates: list[dict]) -> list[dict]:
     payload = {"query": query, "candidates": [_compact_candidate(r) for r in candidates]}
 
     system = (
@@ -35,18 +28,14 @@ def llm_rerank_top1(query: str, candidates: list[dict], model: str = RERANK_MODE
         "Prefer specificity and direct match to the query constraints. "
         "Return ONLY JSON: {\"best_rank\": <rank_number_from_candidates>}."
     )
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+    ]
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        temperature=0
-    )
-
-    text = (resp.choices[0].message.content or "").strip()
-    m = re.search(r"\{.*\}", text, flags=re.S)
+def parse_rerank_choice(text: str, candidates: list[dict]) -> int:
+    """Model output -> chosen_index (0-based); falls back to 0."""
+    m = re.search(r"\{.*\}", (text or "").strip(), flags=re.S)
     if not m:
         return 0
 
@@ -58,10 +47,166 @@ def llm_rerank_top1(query: str, candidates: list[dict], model: str = RERANK_MODE
             return i
     return 0
 
+def llm_rerank_top1(query: str, candidates: list[dict], model: str = RERANK_MODEL) -> int:
+    """
+    Returns: chosen_index (0-based) among candidates
+    """
+    if not candidates:
+        return 0
+
+    resp = create_chat_completion(
+        "rerank",
+        model=model,
+        messages=build_rerank_messages(query, candidates),
+        temperature=0,
+        timeout_s=RERANK_TIMEOUT_S,
+    )
+    record_usage("rerank", resp.usage)
+
+    return parse_rerank_choice(resp.choices[0].message.content or "", candidates)
+
 def promote_chosen_to_top(candidates: list[dict], chosen_i: int) -> list[dict]:
     chosen = candidates[chosen_i]
     rest = [r for j, r in enumerate(candidates) if j != chosen_i]
     reranked = [chosen] + rest
     for i, r in enumerate(reranked, start=1):
         r["rank"] = i
-    return reranked
\ No newline at end of file
+    return reranked
+
+# ---- listwise: one call -> full ordering of the candidates ----
+def _excerpt(text: str, max_tokens: int) -> str:
+    # ~0.75 words per token for English prose; whitespace collapsed
+    words = (text or "").split()
+    n = max(1, int(max_tokens * 0.75))
+    return " ".join(words[:n]) + (" …" if len(words) > n else "")
+
+def _doc_header(r: dict) -> str:
+    # chunk metadata carries company / year / section; "source" is the ingest format
+    # (e.g. sec_10k_html), identical for every doc, so it is left out
+    parts = [r.get("company"), r.get("year"), r.get("section")]
+    return " | ".join(str(p) for p in parts if p) or str(r.get("doc_id") or "")
+
+def build_listwise_messages(
+    query: str,
+    candidates: list[dict],
+    *,
+    excerpt_tokens: int = RERANK_EXCERPT_TOKENS,
+) -> list[dict]:
+    """
+    Compact plain-text encoding instead of one JSON object per candidate:
+    - candidates are short numeric handles [1]..[n]
+    - each doc header (company / year / section) is listed once as D1..Dm
+    - each candidate carries only a token-budgeted excerpt
+    """
+    doc_handles: dict[str, str] = {}
+    doc_lines, cand_lines = [], []
+    for i, r in enumerate(candidates, start=1):
+        key = str(r.get("doc_id") or f"_{i}")
+        if key not in doc_handles:
+            doc_handles[key] = f"D{len(doc_handles) + 1}"
+            doc_lines.append(f"{doc_handles[key]}: {_doc_header(r)}")
+        text = r.get("text_preview") or r.get("text") or ""   # same source as _compact_candidate
+        cand_lines.append(f"[{i}] {doc_handles[key]}: {_excerpt(text, excerpt_tokens)}")
+
+    system = (
+        "You are a retrieval reranker for an investment RAG system. "
+        "Order ALL candidates from most to least useful for answering the query with explicit evidence. "
+        "Prefer specificity and direct match to the query constraints. "
+        "Return ONLY JSON: {\"order\": [<candidate numbers, best first>]}."
+    )
+    user = f"QUERY: {query}\n\nDOCS:\n" + "\n".join(doc_lines) + "\n\nCANDIDATES:\n" + "\n".join(cand_lines)
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+_HANDLE_RE = re.compile(r"\[?\s*(\d+)\s*\]?")
+
+def _handle_number(h) -> int | None:
+    """Candidate handle as the model wrote it (3, "3", "[3]", 3.0) -> 3; anything else -> None."""
+    if isinstance(h, bool):
+        return None
+    if isinstance(h, int):
+        return h
+    if isinstance(h, float):
+        return int(h) if h.is_integer() else None
+    if isinstance(h, str):
+        m = _HANDLE_RE.fullmatch(h.strip())
+        return int(m.group(1)) if m else None
+    return None
+
+def parse_listwise_order(text: str, n: int) -> list[int]:
+    """
+    Model output -> permutation of range(n) (0-based). Unknown / repeated / non-integer
+    handles are dropped; candidates the model left out keep their vector order after
+    the ranked ones.
+    """
+    m = re.search(r"\{.*\}", (text or "").strip(), flags=re.S)
+    order: list[int] = []
+    if m:
+        try:
+            raw = json.loads(m.group(0)).get("order") or []
+        except (ValueError, AttributeError):
+            raw = []
+        for h in raw if isinstance(raw, list) else []:
+            num = _handle_number(h)
+            if num is None:
+                continue
+            i = num - 1
+            if 0 <= i < n and i not in order:
+                order.append(i)
+    return order + [i for i in range(n) if i not in order]
+
+def llm_rerank_listwise(query: str, candidates: list[dict], model: str = RERANK_MODEL) -> list[int]:
+    """
+    Returns: full ordering (0-based candidate indices, best first)
+    """
+    if not candidates:
+        return []
+
+    resp = create_chat_completion(
+        "rerank",
+        model=model,
+        messages=build_listwise_messages(query, candidates),
+        temperature=0,
+        timeout_s=RERANK_TIMEOUT_S,
+    )
+    record_usage("rerank", resp.usage)
+
+    return parse_listwise_order(resp.choices[0].message.content or "", len(candidates))
+
+def apply_order(candidates: list[dict], order: list[int]) -> list[dict]:
+    """Listwise counterpart of promote_chosen_to_top (also rewrites rank in place)."""
+    reranked = [candidates[i] for i in order]
+    for i, r in enumerate(reranked, start=1):
+        r["rank"] = i
+    return reranked
+
+# ---- mode dispatch (top1 | listwise) -> full ordering ----
+RERANK_MODES = ("top1", "listwise")
+
+def _check_mode(mode: str) -> None:
+    if mode not in RERANK_MODES:
+        raise ValueError(f"Unknown rerank mode: {mode} (expected one of {RERANK_MODES})")
+
+def top1_order(chosen_i: int, n: int) -> list[int]:
+    return [chosen_i] + [i for i in range(n) if i != chosen_i]
+
+def build_mode_messages(query: str, candidates: list[dict], mode: str = RERANK_MODE) -> list[dict]:
+    _check_mode(mode)
+    if mode == "listwise":
+        return build_listwise_messages(query, candidates)
+    return build_rerank_messages(query, candidates)
+
+def parse_mode_order(text: str, candidates: list[dict], mode: str = RERANK_MODE) -> list[int]:
+    _check_mode(mode)
+    if mode == "listwise":
+        return parse_listwise_order(text, len(candidates))
+    return top1_order(parse_rerank_choice(text, candidates), len(candidates))
+
+def llm_rerank_order(query: str, candidates: list[dict], *, mode: str = RERANK_MODE, model: str = RERANK_MODEL) -> list[int]:
+    """One rerank call in either mode -> full ordering (0-based, best first)."""
+    _check_mode(mode)
+    if mode == "listwise":
+        return llm_rerank_listwise(query, candidates, model=model)
+    return top1_order(llm_rerank_top1(query, candidates, model=model), len(candidates))
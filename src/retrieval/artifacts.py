@@ -5,6 +5,7 @@ from dataclasses import dataclass
 from pathlib import Path
 import hashlib
 import json
+import os
 from datetime import datetime
 
 
@@ -60,4 +61,36 @@ def write_json(path: Path, data: dict) -> None:
 
 
 def utc_now_iso() -> str:
-    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
\ No newline at end of file
+    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+# ---- Versioned index directories + atomic "current" pointer ----
+VERSIONS_DIR = "versions"
+CURRENT_POINTER = "CURRENT"
+
+
+def index_version_id(chunks_sha1: str, build_params: dict) -> str:
+    """Stable id for an index build: chunks content + build parameters."""
+    blob = json.dumps({"chunks_sha1": chunks_sha1, **build_params}, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def write_current_pointer(index_root: Path, version_id: str) -> None:
+    """Atomically repoint index_root/CURRENT (write temp file, then os.replace)."""
+    index_root.mkdir(parents=True, exist_ok=True)
+    tmp = index_root / f".{CURRENT_POINTER}.{os.getpid()}.tmp"
+    tmp.write_text(version_id + "\n", encoding="utf-8")
+    os.replace(tmp, index_root / CURRENT_POINTER)
+
+
+def read_current_version(index_root: Path) -> str | None:
+    p = index_root / CURRENT_POINTER
+    if not p.exists():
+        return None
+    v = p.read_text(encoding="utf-8").strip()
+    return v or None
+
+
+def current_version_dir(index_root: Path) -> Path | None:
+    v = read_current_version(index_root)
+    return index_root / VERSIONS_DIR / v if v else None
@@ -3,17 +3,35 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
+import hashlib
 import json
+import os
+import re
+import shutil
+import uuid
 
 import numpy as np
 import faiss
 
-from src.config import EMBED_MODEL, BATCH_SIZE, INDEX_TYPE, NORMALIZE
+from src.config import EMBED_MODEL, LOCAL_EMBED_DIM, BATCH_SIZE, INDEX_TYPE, NORMALIZE, COARSE_DIM, DOC_POOLING, DEDUP_THRESHOLD
 from src.llm.embedding import embed_texts
+from src.llm.batch import BatchExecutor, embed_texts_batch
+from src.llm.embedding_cache import EmbeddingCache
+from src.llm.local_embedding import LsaEmbedder, is_local_model
+from src.data_pipeline.io_utils import read_jsonl
 from src.retrieval.chunk_loader import load_chunks_for_index
-from src.retrieval.vector_store import l2_normalize
+from src.retrieval.dedup import find_near_duplicates
+from src.retrieval.vector_store import FULL_VECS_NAME, l2_normalize, truncate_and_normalize
 
-from src.retrieval.artifacts import build_chunks_manifest, write_json, utc_now_iso  
+from src.retrieval.artifacts import (
+    VERSIONS_DIR,
+    build_chunks_manifest,
+    file_sha1,
+    index_version_id,
+    utc_now_iso,
+    write_current_pointer,
+    write_json,
+)
 
 
 @dataclass(frozen=True)
@@ -22,6 +40,81 @@ class BuildIndexResult:
     meta_path: str
     n_vectors: int
     dim: int
+    coarse_index_path: str | None = None
+    coarse_dim: int | None = None
+    doc_index_path: str | None = None
+    n_docs: int = 0
+    n_duplicates_removed: int = 0
+
+
+def build_doc_pooled_index(
+    vecs: np.ndarray,
+    metas: list[dict],
+    *,
+    pooling: str = "mean",
+    row_map: list[int] | None = None,
+) -> tuple[faiss.Index, list[dict]]:
+    """
+    One vector per doc_id: mean or max over its chunk vectors, then L2-normalized.
+    Returns the index and doc rows {doc_id, n_chunks, chunk_rows}, where chunk_rows
+    are row ids into the chunk index (used to search only those docs' chunks).
+    row_map translates vecs rows to chunk-index rows (after near-duplicate collapse); a
+    row shared with another doc is that doc's canonical chunk, listed in its "aliases"
+    under this doc_id (VectorStore resolves it back per doc).
+    """
+    if pooling not in ("mean", "max"):
+        raise ValueError(f"Unsupported doc pooling: {pooling} (use 'mean' or 'max')")
+
+    rows_by_doc: dict[str, list[int]] = {}
+    for i, m in enumerate(metas):
+        doc_id = (m or {}).get("doc_id")
+        if doc_id:
+            rows_by_doc.setdefault(str(doc_id), []).append(i)
+    if not rows_by_doc:
+        raise ValueError("No doc_id in chunk metadata; cannot build a doc-level index.")
+
+    doc_ids = sorted(rows_by_doc)
+    pooled = np.empty((len(doc_ids), vecs.shape[1]), dtype=np.float32)
+    for j, doc_id in enumerate(doc_ids):
+        block = vecs[rows_by_doc[doc_id]]
+        pooled[j] = block.mean(axis=0) if pooling == "mean" else block.max(axis=0)
+
+    index = faiss.IndexFlatIP(int(vecs.shape[1]))
+    index.add(l2_normalize(pooled).astype(np.float32))
+    doc_rows = []
+    for d in doc_ids:
+        rows = rows_by_doc[d]
+        if row_map is not None:
+            rows = sorted({row_map[i] for i in rows})
+        doc_rows.append({"doc_id": d, "n_chunks": len(rows_by_doc[d]), "chunk_rows": rows})
+    return index, doc_rows
+
+
+def index_build_params(
+    *,
+    embed_model: str = EMBED_MODEL,
+    normalize: bool = NORMALIZE,
+    index_type: str = INDEX_TYPE,
+    save_text_in_meta: bool = True,
+    coarse_dim: int | None = COARSE_DIM,
+    doc_pooling: str | None = DOC_POOLING,
+    dedup_threshold: float | None = DEDUP_THRESHOLD,
+    **_runtime,
+) -> dict:
+    """
+    Build parameters that change the index contents (hashed with the chunks sha1 into
+    index_version_id). Runtime-only kwargs (batch_size, caches, executors) are ignored.
+    """
+    return {
+        "embed_model": embed_model,
+        "local_embed_dim": LOCAL_EMBED_DIM if is_local_model(embed_model) else None,
+        "normalize": normalize,
+        "faiss_index": index_type,
+        "save_text_in_meta": save_text_in_meta,
+        "coarse_dim": coarse_dim,
+        "doc_pooling": doc_pooling,
+        "dedup_threshold": dedup_threshold,
+    }
 
 
 def build_vector_index(
@@ -34,18 +127,52 @@ def build_vector_index(
     index_type: str = INDEX_TYPE,
     normalize: bool = NORMALIZE,
     save_text_in_meta: bool = True,
+    coarse_dim: int | None = COARSE_DIM,
+    coarse_index_path: Path | None = None,
+    doc_pooling: str | None = DOC_POOLING,
+    dedup_threshold: float | None = DEDUP_THRESHOLD,
+    embedding_cache: EmbeddingCache | None = None,
+    batch_executor: BatchExecutor | None = None,
 ) -> BuildIndexResult:
     # 1) load texts (deterministic) + filter empty
     res = load_chunks_for_index(chunks_path, sort_by_chunk_id=True, drop_empty_texts=True)
 
-    # 2) embed
-    vecs = embed_texts(res.texts, model=embed_model, batch_size=batch_size)
+    # 2) embed (API model, or local LSA fitted on these chunks and saved next to the index)
+    lsa = None
+    if is_local_model(embed_model):
+        lsa = LsaEmbedder.fit(res.texts, dim=LOCAL_EMBED_DIM)
+        vecs = lsa.transform(res.texts)
+    elif embedding_cache is not None:
+        if embedding_cache.model != embed_model:
+            raise ValueError(f"embedding_cache is for {embedding_cache.model}, not {embed_model}")
+        vecs = embedding_cache.embed(res.texts, batch_size=batch_size)
+    elif batch_executor is not None:
+        # offline batch file (provider batch pricing); the request files stay next to the index
+        vecs = embed_texts_batch(res.texts, executor=batch_executor, work_dir=index_path.parent / "batch",
+                                 model=embed_model, batch_size=batch_size)
+    else:
+        vecs = embed_texts(res.texts, model=embed_model, batch_size=batch_size)
     vecs = np.asarray(vecs, dtype=np.float32)
 
     # 3) normalize for cosine
     if normalize:
         vecs = l2_normalize(vecs)
 
+    # 3b) optional near-duplicate collapse (boilerplate, overlap sentences)
+    all_vecs, keep = vecs, list(range(len(res.chunk_ids)))
+    row_map, aliases = None, {}
+    if dedup_threshold:
+        dd = find_near_duplicates(vecs, threshold=dedup_threshold)
+        keep = dd.keep_rows
+        new_row = {orig: new for new, orig in enumerate(keep)}
+        row_map = [new_row[c] for c in dd.canonical_of]
+        for i, c in enumerate(dd.canonical_of):
+            if i != c:
+                aliases.setdefault(c, []).append({"chunk_id": res.chunk_ids[i], "doc_id": res.metas[i].get("doc_id")})
+        vecs = np.ascontiguousarray(vecs[keep])
+        print(f"[dedup] {dd.n_before} -> {dd.n_after} vectors "
+              f"(-{dd.n_removed}, {dd.n_removed / max(dd.n_before, 1):.1%}) at cosine >= {dedup_threshold}")
+
     # 4) build FAISS
     dim = int(vecs.shape[1])
     if index_type != "IndexFlatIP":
@@ -55,17 +182,45 @@ def build_vector_index(
     assert vecs.shape[1] == index.d, "Embedding dimension mismatch with FAISS index."
     index.add(vecs)
 
+    # 4b) optional coarse index over the truncated (Matryoshka) prefix; the full vectors
+    #     are also saved as float16 .npy, which the store memory-maps for the re-score pass
+    #     instead of loading index.bin (index.bin stays on disk for non-coarse loads)
+    coarse_index = None
+    if coarse_dim:
+        if coarse_index_path is None:
+            coarse_index_path = index_path.with_name(f"{index_path.stem}_coarse{index_path.suffix}")
+        coarse_index = faiss.IndexFlatIP(int(coarse_dim))
+        coarse_index.add(truncate_and_normalize(vecs, int(coarse_dim)))
+
+    # 4c) optional doc-level index of pooled chunk vectors (keyed by metadata doc_id)
+    doc_index, doc_rows = None, []
+    if doc_pooling:
+        doc_index, doc_rows = build_doc_pooled_index(all_vecs, res.metas, pooling=doc_pooling, row_map=row_map)
+
     # 5) save index + meta
     index_path.parent.mkdir(parents=True, exist_ok=True)
     meta_path.parent.mkdir(parents=True, exist_ok=True)
 
     faiss.write_index(index, str(index_path))
+    if lsa is not None:
+        lsa.save(index_path.with_name("lsa_model.npz"))
+    if coarse_index is not None:
+        faiss.write_index(coarse_index, str(coarse_index_path))
+        np.save(index_path.with_name(FULL_VECS_NAME), vecs.astype(np.float16))
+    doc_index_path = index_path.with_name("doc_index.bin")
+    if doc_index is not None:
+        faiss.write_index(doc_index, str(doc_index_path))
+        with doc_index_path.with_name("doc_meta.jsonl").open("w", encoding="utf-8") as f:
+            for row in doc_rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
     with meta_path.open("w", encoding="utf-8") as f:
-        for cid, t, m in zip(res.chunk_ids, res.texts, res.metas):
-            row = {"chunk_id": cid, **m}
+        for i in keep:
+            row = {"chunk_id": res.chunk_ids[i], **res.metas[i]}
             if save_text_in_meta:
-                row["text"] = t
+                row["text"] = res.texts[i]
+            if i in aliases:
+                row["aliases"] = aliases[i]
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
     # 6) save reproducibility artifacts next to the index
@@ -75,6 +230,9 @@ def build_vector_index(
     build_config = {
         "created_at": utc_now_iso(),
         "embed_model": embed_model,
+        "embed_backend": "local-lsa" if lsa is not None else "api",
+        "lsa_dim": lsa.dim if lsa is not None else None,
+        "lsa_vocab_size": len(lsa.vocab) if lsa is not None else None,
         "batch_size": batch_size,
         "normalize": normalize,
         "faiss_index": index_type,
@@ -84,6 +242,14 @@ def build_vector_index(
         "chunks_path": str(chunks_path),
         "index_path": str(index_path),
         "meta_path": str(meta_path),
+        "coarse_dim": int(coarse_dim) if coarse_index is not None else None,
+        "coarse_index_path": str(coarse_index_path) if coarse_index is not None else None,
+        "doc_pooling": doc_pooling if doc_index is not None else None,
+        "n_docs": int(doc_index.ntotal) if doc_index is not None else 0,
+        "doc_index_path": str(doc_index_path) if doc_index is not None else None,
+        "dedup_threshold": dedup_threshold,
+        "n_chunks_before_dedup": len(res.chunk_ids),
+        "n_duplicates_removed": len(res.chunk_ids) - int(index.ntotal),
     }
     write_json(out_dir / "build_config.json", build_config)
 
@@ -101,4 +267,193 @@ def build_vector_index(
         meta_path=str(meta_path),
         n_vectors=index.ntotal,
         dim=index.d,
-    )
\ No newline at end of file
+        coarse_index_path=str(coarse_index_path) if coarse_index is not None else None,
+        coarse_dim=int(coarse_dim) if coarse_index is not None else None,
+        doc_index_path=str(doc_index_path) if doc_index is not None else None,
+        n_docs=int(doc_index.ntotal) if doc_index is not None else 0,
+        n_duplicates_removed=len(res.chunk_ids) - int(index.ntotal),
+    )
+
+
+# ---- Sharded build (one sub-index per company / year) ----
+
+def shard_dir_name(value) -> str:
+    name = re.sub(r"[^0-9a-zA-Z]+", "_", str(value)).strip("_").lower()
+    return name or "unknown"
+
+
+@dataclass(frozen=True)
+class BuildShardsResult:
+    shards_dir: str
+    shard_key: str
+    built: list[str]
+    skipped: list[str]
+    n_vectors: int
+
+
+def build_sharded_vector_index(
+    *,
+    chunks_path: Path,
+    shards_dir: Path,
+    shard_key: str = "company",
+    only_shards: list[str] | None = None,
+    force: bool = False,
+    **build_kwargs,
+) -> BuildShardsResult:
+    """
+    Partition chunks by metadata[shard_key] and build one index per shard under
+    shards_dir/<shard>/ (index.bin, meta.jsonl, build_config.json, chunks_manifest.json).
+    - A shard whose chunk subset and build params are unchanged (same build_id, i.e.
+      index_version_id of its chunks sha1 + index_build_params) is skipped unless force=True.
+    - only_shards limits the rebuild to the given shard names.
+    - shards.json lists every shard currently on disk.
+    """
+    if is_local_model(build_kwargs.get("embed_model", EMBED_MODEL)):
+        # each shard would fit its own LSA space, so one query vector could not be fanned out
+        raise ValueError("Sharded builds require an API embedding model (local LSA is fitted per index).")
+
+    groups: dict[str, list[dict]] = {}
+    values: dict[str, str] = {}
+    for row in read_jsonl(chunks_path):
+        value = (row.get("metadata") or {}).get(shard_key)
+        name = shard_dir_name(value)
+        groups.setdefault(name, []).append(row)
+        values[name] = str(value)
+
+    params = index_build_params(**build_kwargs)
+    built, skipped = [], []
+    for name in sorted(groups):
+        if only_shards is not None and name not in only_shards:
+            continue
+
+        shard_dir = shards_dir / name
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in groups[name]).encode("utf-8")
+        build_id = index_version_id(hashlib.sha1(payload).hexdigest(), params)
+
+        cfg_path = shard_dir / "build_config.json"
+        if not force and cfg_path.exists() and (shard_dir / "index.bin").exists():
+            old = json.loads(cfg_path.read_text(encoding="utf-8"))
+            if old.get("build_id") == build_id:
+                skipped.append(name)
+                continue
+
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        shard_chunks = shard_dir / "chunks.jsonl"
+        shard_chunks.write_bytes(payload)
+        build_vector_index(
+            chunks_path=shard_chunks,
+            index_path=shard_dir / "index.bin",
+            meta_path=shard_dir / "meta.jsonl",
+            **build_kwargs,
+        )
+        cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+        cfg["build_id"] = build_id
+        write_json(cfg_path, cfg)
+        built.append(name)
+
+    # top-level manifest over everything on disk (shards built earlier included)
+    shards = []
+    n_total = 0
+    for shard_dir in sorted(p for p in shards_dir.iterdir() if (p / "build_config.json").exists()):
+        cfg = json.loads((shard_dir / "build_config.json").read_text(encoding="utf-8"))
+        n_total += int(cfg["n_vectors"])
+        shards.append({
+            "name": shard_dir.name,
+            "value": values.get(shard_dir.name, shard_dir.name),
+            "n_vectors": int(cfg["n_vectors"]),
+            "created_at": cfg.get("created_at"),
+        })
+    write_json(shards_dir / "shards.json", {
+        "created_at": utc_now_iso(),
+        "shard_key": shard_key,
+        "chunks_path": str(chunks_path),
+        "n_vectors": n_total,
+        "shards": shards,
+    })
+
+    return BuildShardsResult(
+        shards_dir=str(shards_dir),
+        shard_key=shard_key,
+        built=built,
+        skipped=skipped,
+        n_vectors=n_total,
+    )
+
+
+# ---- Versioned build (immutable versions/<id>/ + atomic CURRENT pointer) ----
+
+@dataclass(frozen=True)
+class BuildVersionResult:
+    version_id: str
+    version_dir: str
+    reused: bool
+
+
+def build_versioned_index(
+    *,
+    chunks_path: Path,
+    index_root: Path,
+    embed_model: str = EMBED_MODEL,
+    normalize: bool = NORMALIZE,
+    index_type: str = INDEX_TYPE,
+    save_text_in_meta: bool = True,
+    coarse_dim: int | None = COARSE_DIM,
+    doc_pooling: str | None = DOC_POOLING,
+    dedup_threshold: float | None = DEDUP_THRESHOLD,
+    publish: bool = True,
+    force: bool = False,
+    **build_kwargs,
+) -> BuildVersionResult:
+    """
+    Build into a staging dir, then rename to index_root/versions/<version_id>/ and
+    repoint index_root/CURRENT. Published versions are never modified in place, so a
+    running service can keep reading the old version while the new one is built.
+    The version id hashes the chunks sha1 + build params; an existing version is reused.
+    force=True adds a build nonce to the params, so the rebuild gets a new version id
+    (published through CURRENT like any other build; the old version is left intact).
+    """
+    params = index_build_params(
+        embed_model=embed_model, normalize=normalize, index_type=index_type,
+        save_text_in_meta=save_text_in_meta, coarse_dim=coarse_dim,
+        doc_pooling=doc_pooling, dedup_threshold=dedup_threshold,
+    )
+    if force:
+        params["rebuild_nonce"] = uuid.uuid4().hex
+    version_id = index_version_id(file_sha1(chunks_path), params)
+    versions = index_root / VERSIONS_DIR
+    final_dir = versions / version_id
+
+    reused = (final_dir / "build_config.json").exists()
+    if not reused:
+        staging = versions / f".staging-{version_id}-{os.getpid()}"
+        if staging.exists():
+            shutil.rmtree(staging)
+        build_vector_index(
+            chunks_path=chunks_path,
+            index_path=staging / "index.bin",
+            meta_path=staging / "meta.jsonl",
+            embed_model=embed_model,
+            normalize=normalize,
+            index_type=index_type,
+            save_text_in_meta=save_text_in_meta,
+            coarse_dim=coarse_dim,
+            doc_pooling=doc_pooling,
+            dedup_threshold=dedup_threshold,
+            **build_kwargs,
+        )
+
+        # record final (post-rename) paths in build_config.json
+        cfg_path = staging / "build_config.json"
+        cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+        for key in ("index_path", "meta_path", "coarse_index_path", "doc_index_path"):
+            if cfg.get(key):
+                cfg[key] = str(final_dir / Path(cfg[key]).name)
+        cfg["version_id"] = version_id
+        write_json(cfg_path, cfg)
+
+        os.replace(staging, final_dir)
+
+    if publish:
+        write_current_pointer(index_root, version_id)
+
+    return BuildVersionResult(version_id=version_id, version_dir=str(final_dir), reused=reused)
@@ -0,0 +1,55 @@
+# src/retrieval/dedup.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import faiss
+
+from src.retrieval.vector_store import l2_normalize
+
+
+@dataclass(frozen=True)
+class DedupResult:
+    keep_rows: list[int]          # original rows kept as canonical vectors (in order)
+    canonical_of: list[int]       # original row -> original row of its canonical
+    n_before: int
+    n_after: int
+
+    @property
+    def n_removed(self) -> int:
+        return self.n_before - self.n_after
+
+
+def find_near_duplicates(
+    vecs: np.ndarray,
+    *,
+    threshold: float = 0.97,
+) -> DedupResult:
+    """
+    Greedy near-duplicate collapse on cosine similarity.
+    - range_search finds, for every vector, all neighbours with cosine >= threshold.
+    - Rows are visited in order; an unassigned row becomes canonical and absorbs its
+      unassigned neighbours as aliases. Deterministic given a fixed row order.
+    """
+    x = np.ascontiguousarray(l2_normalize(np.asarray(vecs, dtype=np.float32)), dtype=np.float32)
+    n = int(x.shape[0])
+
+    index = faiss.IndexFlatIP(int(x.shape[1]))
+    index.add(x)
+    # IP range_search returns hits with score > radius
+    lims, _, labels = index.range_search(x, float(threshold) - 1e-6)
+
+    canonical_of = [-1] * n
+    keep_rows: list[int] = []
+    for i in range(n):
+        if canonical_of[i] >= 0:
+            continue
+        canonical_of[i] = i
+        keep_rows.append(i)
+        for j in labels[lims[i]:lims[i + 1]]:
+            j = int(j)
+            if canonical_of[j] < 0:
+                canonical_of[j] = i
+
+    return DedupResult(keep_rows=keep_rows, canonical_of=canonical_of, n_before=n, n_after=len(keep_rows))
@@ -0,0 +1,114 @@
+# src/retrieval/hits.py
+from __future__ import annotations
+
+from collections.abc import Iterator, MutableMapping
+from typing import Any
+
+import numpy as np
+
+_OWN = ("rank", "score")
+
+
+class Hit(MutableMapping):
+    """
+    One search hit without copying its metadata: rank / score / row live on the record,
+    every other field is read lazily from the store's shared meta row (hit["text"],
+    hit.get("doc_id") or hit.doc_id).
+
+    Behaves like the {"rank", "score", **meta} dict search used to return, so dict
+    consumers keep working. Writes never touch the shared meta: rank / score are set on
+    the record, anything else is kept as a per-hit override. Pickles (and dict(hit)
+    copies) as a plain dict, so only the hit crosses process boundaries.
+    """
+
+    __slots__ = ("rank", "score", "row", "_meta", "_extra")
+
+    def __init__(self, meta: list[dict], row: int, rank: int, score: float, extra: dict | None = None):
+        self._meta = meta
+        self.row = row
+        self.rank = rank
+        self.score = score
+        self._extra = extra
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _OWN:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self._meta[self.row][key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _OWN:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if self._extra is None or key not in self._extra:
+            raise KeyError(f"{key!r} is not a per-hit field (shared meta is read-only)")
+        del self._extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        extra = self._extra or {}
+        yield from _OWN
+        yield from extra
+        yield from (k for k in self._meta[self.row] if k not in extra and k not in _OWN)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for names that are not slots: lazy meta fields
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def copy(self) -> "Hit":
+        """Independent record over the same shared meta (like dict.copy on the old hits)."""
+        return Hit(self._meta, self.row, self.rank, self.score, dict(self._extra) if self._extra else None)
+
+    def to_dict(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"Hit(rank={self.rank}, score={self.score:.4f}, row={self.row}, chunk_id={self.get('chunk_id')!r})"
+
+
+class HitList(list):
+    """
+    Ranked list of Hit records plus the raw FAISS arrays they came from
+    (rows / scores in search order), for consumers that want vectorized access.
+    """
+
+    def __init__(self, hits=(), *, rows: np.ndarray | None = None, scores: np.ndarray | None = None, meta: list[dict] | None = None):
+        super().__init__(hits)
+        self.rows = np.asarray(rows if rows is not None else [h.row for h in self], dtype=np.int64)
+        self.scores = np.asarray(scores if scores is not None else [h.score for h in self], dtype=np.float32)
+        self._meta = meta
+
+    @property
+    def ids(self) -> np.ndarray:
+        """chunk_id per row (object array, resolved on access)."""
+        meta = self._meta or []
+        return np.array([meta[i].get("chunk_id") for i in self.rows], dtype=object)
+
+    @classmethod
+    def from_search(cls, meta: list[dict], idxs: np.ndarray, scores: np.ndarray) -> "HitList":
+        """One FAISS result row (idxs, scores) -> records; -1 padding is dropped, ranks stay 1..n."""
+        keep = idxs >= 0
+        rows, scores = idxs[keep].astype(np.int64), scores[keep].astype(np.float32)
+        hits = [Hit(meta, int(i), rank, float(s)) for rank, (i, s) in enumerate(zip(rows, scores), start=1)]
+        return cls(hits, rows=rows, scores=scores, meta=meta)
+
+
+def to_dicts(hits: list) -> list[dict]:
+    """Adapter for consumers that need real dicts (JSON, deep mutation)."""
+    return [h.to_dict() if isinstance(h, Hit) else dict(h) for h in hits]
@@ -0,0 +1,143 @@
+# src/retrieval/relevance_gate.py
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+import json
+import re
+
+import numpy as np
+
+NOT_ENOUGH_INFO = "I don't have enough information in the indexed filings to answer that."
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "and", "for", "what", "which", "how", "its", "that", "with", "from", "this",
+    "are", "was", "were", "does", "did", "company", "companies", "describe", "described",
+    "explain", "according", "about", "into", "their", "there", "than", "has", "have",
+}
+
+
+def _content_tokens(text: str) -> set[str]:
+    return {t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) >= 3 and t not in _STOPWORDS}
+
+
+def gate_features(query: str, results: list[dict], *, n_text: int = 3) -> dict:
+    """
+    Evidence signals from one vector search:
+    - top1: best FAISS score
+    - margin: top1 minus mean score of the list
+    - overlap: fraction of query content tokens present in the top-n_text texts
+      (lexical signal; stands in for BM25 overlap, which this repo has no index for)
+    """
+    scores = [float(r.get("score", 0.0)) for r in results]
+    if not scores:
+        return {"top1": float("-inf"), "margin": 0.0, "overlap": 0.0}
+
+    q = _content_tokens(query)
+    seen: set[str] = set()
+    for r in results[:n_text]:
+        seen |= _content_tokens(r.get("text") or r.get("text_preview") or "")
+    overlap = len(q & seen) / len(q) if q else 0.0
+
+    return {
+        "top1": scores[0],
+        "margin": scores[0] - float(np.mean(scores)),
+        "overlap": overlap,
+    }
+
+
+@dataclass(frozen=True)
+class RelevanceGate:
+    """
+    Refuse when BOTH the top score and the lexical overlap are below their thresholds.
+    min_top1 is a raw FAISS score, only meaningful for the index it was calibrated on
+    (index_version / embed_model; see matches()).
+    """
+    min_top1: float
+    min_overlap: float = float("inf")   # inf = lexical signal never rescues a low score
+    false_refusal_rate: float | None = None
+    ood_refusal_rate: float | None = None
+    n_in_scope: int = 0
+    n_ood: int = 0
+    index_version: str | None = None
+    embed_model: str | None = None
+
+    def passes(self, query: str, results: list[dict]) -> bool:
+        f = gate_features(query, results)
+        return f["top1"] >= self.min_top1 or f["overlap"] >= self.min_overlap
+
+    def matches(self, index_version: str | None, embed_model: str | None) -> bool:
+        return self.index_version == index_version and self.embed_model == embed_model
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        d = asdict(self)
+        if d["min_overlap"] == float("inf"):
+            d["min_overlap"] = None
+        path.write_text(json.dumps(d, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "RelevanceGate":
+        d = json.loads(path.read_text(encoding="utf-8"))
+        if d.get("min_overlap") is None:
+            d["min_overlap"] = float("inf")
+        return cls(**d)
+
+
+def calibrate_gate(
+    questions: list[dict],
+    *,
+    search_fn: Callable[[str, int], list[dict]],
+    k: int = 10,
+    max_false_refusal: float = 0.025,
+) -> RelevanceGate:
+    """
+    Tune thresholds on eval questions: in-scope = has gold_doc_ids, OOD = no gold.
+    Picks the (min_top1, min_overlap) pair that refuses the most OOD questions while
+    refusing at most max_false_refusal of in-scope ones (ties -> fewer false refusals).
+    Without OOD questions, min_top1 is the largest score within the false-refusal budget.
+    """
+    feats_in, feats_ood = [], []
+    for q in questions:
+        f = gate_features(q["query"], search_fn(q["query"], k))
+        (feats_in if q.get("gold_doc_ids") else feats_ood).append(f)
+    if not feats_in:
+        raise ValueError("Need in-scope questions (with gold_doc_ids) to calibrate the gate.")
+
+    s_in = np.array([f["top1"] for f in feats_in])
+    o_in = np.array([f["overlap"] for f in feats_in])
+    s_ood = np.array([f["top1"] for f in feats_ood])
+    o_ood = np.array([f["overlap"] for f in feats_ood])
+
+    def rates(t_s: float, t_o: float) -> tuple[float, float]:
+        frr = float(np.mean((s_in < t_s) & (o_in < t_o)))
+        orr = float(np.mean((s_ood < t_s) & (o_ood < t_o))) if len(s_ood) else 0.0
+        return frr, orr
+
+    score_grid = np.unique(np.concatenate([s_in, s_ood]))
+    overlap_grid = [float("inf")] + (sorted(set(np.concatenate([o_in, o_ood]).tolist())) if len(s_ood) else [])
+
+    best = (float(score_grid.min()), float("inf"), 0.0, 0.0)   # t_s, t_o, frr, orr
+    for t_s in score_grid:
+        for t_o in overlap_grid:
+            frr, orr = rates(float(t_s), t_o)
+            if frr > max_false_refusal:
+                continue
+            if len(s_ood):
+                # most OOD refused, then fewest false refusals, then the loosest gate
+                better = (orr, -frr, -t_s) > (best[3], -best[2], -best[0])
+            else:
+                better = t_s > best[0]
+            if better:
+                best = (float(t_s), t_o, frr, orr)
+
+    return RelevanceGate(
+        min_top1=best[0],
+        min_overlap=best[1],
+        false_refusal_rate=best[2],
+        ood_refusal_rate=best[3] if len(s_ood) else None,
+        n_in_scope=len(feats_in),
+        n_ood=len(feats_ood),
+    )
@@ -0,0 +1,155 @@
+# src/retrieval/sharded_store.py
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable
+import heapq
+import json
+
+import numpy as np
+
+from src.retrieval.build_vector_index import shard_dir_name
+from src.retrieval.vector_store import VectorStore
+
+
+# ---- process-mode worker (one process per shard, store loaded once) ----
+_WORKER_STORE: VectorStore | None = None
+
+
+def _init_worker(shard_dir: str) -> None:
+    global _WORKER_STORE
+    d = Path(shard_dir)
+    _WORKER_STORE = VectorStore.load(
+        index_path=d / "index.bin",
+        meta_path=d / "meta.jsonl",
+        coarse_index_path=d / "index_coarse.bin",
+        doc_index_path=d / "doc_index.bin",
+    )
+
+
+def _worker_search(qv: np.ndarray, k: int) -> list[dict]:
+    assert _WORKER_STORE is not None, "Shard worker not initialized."
+    return _WORKER_STORE.search_by_vector(qv, k=k)
+
+
+def _worker_search_batch(qvs: np.ndarray, k: int) -> list[list[dict]]:
+    assert _WORKER_STORE is not None, "Shard worker not initialized."
+    return _WORKER_STORE.search_batch(qvs, k=k)
+
+
+@dataclass
+class ShardedVectorStore:
+    """
+    VectorStore-compatible front end over shards written by build_sharded_vector_index.
+    - mode="thread": shards loaded in-process, searched on a thread pool (FAISS releases the GIL).
+    - mode="process": each shard lives in its own local worker process.
+    Results from all shards are merged by score and re-ranked 1..k.
+    """
+    shard_key: str
+    shards: dict[str, VectorStore] = field(default_factory=dict)
+    mode: str = "thread"
+    _pool: ThreadPoolExecutor | None = None
+    _workers: dict[str, ProcessPoolExecutor] = field(default_factory=dict)
+    # VectorStore interface: shards are always API-embedded (build_sharded_vector_index
+    # rejects local backends), so queries go through the API embedder
+    query_embedder: Callable[[str], np.ndarray] | None = None
+
+    @classmethod
+    def load(
+        cls,
+        shards_dir: Path,
+        *,
+        only: Iterable[str] | None = None,
+        mode: str = "thread",
+    ) -> "ShardedVectorStore":
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported mode: {mode} (use 'thread' or 'process')")
+
+        manifest = json.loads((shards_dir / "shards.json").read_text(encoding="utf-8"))
+        wanted = {shard_dir_name(x) for x in only} if only is not None else None
+        names = [s["name"] for s in manifest["shards"] if wanted is None or s["name"] in wanted]
+        if not names:
+            raise ValueError(f"No shards selected under {shards_dir}")
+
+        store = cls(shard_key=manifest["shard_key"], mode=mode)
+        for name in names:
+            shard_dir = shards_dir / name
+            if mode == "thread":
+                store.shards[name] = VectorStore.load(
+                    index_path=shard_dir / "index.bin",
+                    meta_path=shard_dir / "meta.jsonl",
+                    coarse_index_path=shard_dir / "index_coarse.bin",
+                    doc_index_path=shard_dir / "doc_index.bin",
+                )
+            else:
+                store._workers[name] = ProcessPoolExecutor(
+                    max_workers=1, initializer=_init_worker, initargs=(str(shard_dir),)
+                )
+        if mode == "thread":
+            store._pool = ThreadPoolExecutor(max_workers=len(names))
+        return store
+
+    @property
+    def shard_names(self) -> list[str]:
+        return sorted(self.shards) if self.mode == "thread" else sorted(self._workers)
+
+    def search_by_vector(
+        self,
+        qv: np.ndarray,
+        k: int = 5,
+        shard_filter: Iterable[str] | None = None,
+    ) -> list[dict]:
+        """shard_filter: shard names or raw shard-key values (e.g. {"Apple"}); other shards are skipped."""
+        names = self._select(shard_filter)
+        if not names:
+            return []
+
+        futures = []
+        for name in names:
+            if self.mode == "thread":
+                futures.append(self._pool.submit(self.shards[name].search_by_vector, qv, k))
+            else:
+                futures.append(self._workers[name].submit(_worker_search, qv, k))
+        return _merge([r for f in futures for r in f.result()], k)
+
+    def search_batch(
+        self,
+        qvs: np.ndarray,
+        k: int = 5,
+        shard_filter: Iterable[str] | None = None,
+    ) -> list[list[dict]]:
+        """search_by_vector for many queries: one batched search per shard, merged per row."""
+        names = self._select(shard_filter)
+        if not names:
+            return [[] for _ in range(qvs.shape[0])]
+
+        futures = []
+        for name in names:
+            if self.mode == "thread":
+                futures.append(self._pool.submit(self.shards[name].search_batch, qvs, k))
+            else:
+                futures.append(self._workers[name].submit(_worker_search_batch, qvs, k))
+        per_shard = [f.result() for f in futures]
+        return [_merge([r for rows in per_shard for r in rows[i]], k) for i in range(qvs.shape[0])]
+
+    def _select(self, shard_filter: Iterable[str] | None) -> list[str]:
+        names = self.shard_names
+        if shard_filter is not None:
+            wanted = {shard_dir_name(x) for x in shard_filter}
+            names = [n for n in names if n in wanted]
+        return names
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        for ex in self._workers.values():
+            ex.shutdown(wait=True)
+
+
+def _merge(hits: list[dict], k: int) -> list[dict]:
+    merged = heapq.nlargest(k, hits, key=lambda r: r["score"])
+    for rank, r in enumerate(merged, start=1):
+        r["rank"] = rank
+    return merged
@@ -3,10 +3,17 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
 import numpy as np
 import faiss
 
+from src.config import COARSE_OVERFETCH, DOC_FIRST_OVERFETCH
 from src.data_pipeline.io_utils import read_jsonl
+from src.retrieval.hits import Hit, HitList
+from src.llm.local_embedding import LsaEmbedder
+
+# full-dimension vectors of a coarse-indexed build (float16, memory-mapped at load)
+FULL_VECS_NAME = "vectors_f16.npy"
 
 
 def l2_normalize(x: np.ndarray, eps: float = 1e-12) -> np.ndarray:
@@ -14,22 +21,237 @@ def l2_normalize(x: np.ndarray, eps: float = 1e-12) -> np.ndarray:
     return x / np.maximum(norms, eps)
 
 
+def truncate_and_normalize(x: np.ndarray, dim: int) -> np.ndarray:
+    """Matryoshka prefix: keep the first `dim` components, then re-normalize."""
+    x = np.asarray(x, dtype=np.float32)
+    if dim <= 0 or dim > x.shape[1]:
+        raise ValueError(f"Invalid truncation dim {dim} for vectors of width {x.shape[1]}")
+    return np.ascontiguousarray(l2_normalize(x[:, :dim]), dtype=np.float32)
+
+
+def expand_alias_hits(hits: list[dict]) -> list[dict]:
+    """
+    Insert the near-duplicates collapsed at build time ("aliases" in meta) right after
+    their canonical hit, with the same score and "alias_of" set. Ranks are renumbered.
+    """
+    out = []
+    for h in hits:
+        out.append(h)
+        for a in h.get("aliases") or []:
+            out.append({**h, **a, "alias_of": h.get("chunk_id"), "aliases": None})
+    for rank, h in enumerate(out, start=1):
+        h["rank"] = rank
+    return out
+
+
 @dataclass
 class VectorStore:
-    index: faiss.Index
+    # full-dimension index; None when a coarse build is loaded lean (full_vecs instead)
+    index: faiss.Index | None
     meta: list[dict]
+    coarse_index: faiss.Index | None = None
+    coarse_overfetch: int = COARSE_OVERFETCH
+    # memory-mapped (n, d) float16 full vectors: only shortlist rows are ever read
+    full_vecs: np.ndarray | None = None
+    doc_index: faiss.Index | None = None
+    doc_meta: list[dict] | None = None
+    # set when the index was built with a local embedding backend (lsa_model.npz);
+    # queries must then be embedded in the same space instead of via the API
+    query_embedder: Callable[[str], np.ndarray] | None = None
 
     @classmethod
-    def load(cls, index_path: Path, meta_path: Path) -> "VectorStore":
-        index = faiss.read_index(str(index_path))
+    def load(
+        cls,
+        index_path: Path,
+        meta_path: Path,
+        coarse_index_path: Path | None = None,
+        doc_index_path: Path | None = None,
+    ) -> "VectorStore":
         meta = read_jsonl(meta_path)
-        return cls(index=index, meta=meta)
+        coarse, full_vecs = None, None
+        if coarse_index_path is not None and coarse_index_path.exists():
+            coarse = faiss.read_index(str(coarse_index_path))
+            full_path = index_path.with_name(FULL_VECS_NAME)
+            if full_path.exists():
+                full_vecs = np.load(full_path, mmap_mode="r")
+        # with a coarse index + memmapped full vectors, the full index stays on disk
+        index = faiss.read_index(str(index_path)) if full_vecs is None else None
+        doc_index, doc_meta = None, None
+        if doc_index_path is not None and doc_index_path.exists():
+            doc_index = faiss.read_index(str(doc_index_path))
+            doc_meta = read_jsonl(doc_index_path.with_name("doc_meta.jsonl"))
+        query_embedder = None
+        lsa_path = index_path.with_name("lsa_model.npz")
+        if lsa_path.exists():
+            query_embedder = LsaEmbedder.load(lsa_path).embed_query
+        return cls(
+            index=index,
+            meta=meta,
+            coarse_index=coarse,
+            full_vecs=full_vecs,
+            doc_index=doc_index,
+            doc_meta=doc_meta,
+            query_embedder=query_embedder,
+        )
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else self.coarse_index.ntotal
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Full-dimension float32 vectors for `rows` (memmap read or index reconstruct)."""
+        if self.full_vecs is not None:
+            return np.asarray(self.full_vecs[rows], dtype=np.float32)
+        return self.index.reconstruct_batch(rows)
+
+    def _alias_view(self, row: int, key: str, value) -> dict | None:
+        """
+        Per-hit override that presents canonical `row` as its near-duplicate alias whose
+        `key` is `value` (build-time dedup collapses across docs). None if `row` itself
+        has that value, or no alias does.
+        """
+        m = self.meta[row]
+        if m.get(key) == value:
+            return None
+        for a in m.get("aliases") or []:
+            if a.get(key) == value:
+                return {key: value, "chunk_id": a.get("chunk_id"), "alias_of": m.get("chunk_id")}
+        return None
+
+    def _search_ids(self, qv: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return (scores, idxs) of shape (1, k). Coarse-to-fine when a coarse index is loaded."""
+        if self.coarse_index is None:
+            return self.index.search(qv, k)
+
+        # 1) first pass on the truncated prefix
+        n_cand = min(max(k, k * self.coarse_overfetch), self.coarse_index.ntotal)
+        cq = truncate_and_normalize(qv, self.coarse_index.d)
+        _, cand = self.coarse_index.search(cq, n_cand)
+        cand = cand[0][cand[0] >= 0]
+        if cand.size == 0:
+            return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+
+        # 2) re-score the shortlist with full-dimension vectors
+        scores = self._vectors(cand) @ qv[0]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return scores[order][None, :], cand[order][None, :]
 
-    def search_by_vector(self, qv: np.ndarray, k: int = 5) -> list[dict]:
-        scores, idxs = self.index.search(qv, k)
+    def search_by_vector(self, qv: np.ndarray, k: int = 5, expand_aliases: bool = False) -> list[dict]:
+        """Ranked Hit records (dict-compatible views over self.meta; see src/retrieval/hits.py)."""
+        scores, idxs = self._search_ids(qv, k)
+        out = HitList.from_search(self.meta, idxs[0], scores[0])
+        return expand_alias_hits(out) if expand_aliases else out
+
+    def search_batch(self, qvs: np.ndarray, k: int = 5) -> list[HitList]:
+        """
+        search_by_vector for many queries: (n,d) -> n ranked HitLists. One FAISS call
+        for the whole batch; with a coarse index each row is re-scored on its own.
+        """
+        if self.coarse_index is not None:
+            return [self.search_by_vector(qvs[i:i + 1], k=k) for i in range(qvs.shape[0])]
+        scores, idxs = self.index.search(np.ascontiguousarray(qvs, dtype=np.float32), k)
+        return [HitList.from_search(self.meta, idxs[i], scores[i]) for i in range(qvs.shape[0])]
+
+    def search_grouped(
+        self,
+        qv: np.ndarray,
+        k: int = 5,
+        *,
+        group_key: str = "doc_id",
+        growth: int = 2,
+    ) -> tuple[list[dict], int]:
+        """
+        Collapse-by-group search: k distinct groups (default doc_id), each with its
+        best-scoring chunk. A canonical row also stands for its aliases' groups (a chunk
+        deduplicated across docs is returned for each doc, as that doc's alias). The fetch
+        size starts at 2k and grows by `growth` only while fewer than k groups are found
+        (iterative deepening; stops at ntotal).
+        Returns (results, n_scanned) where n_scanned is the final fetch size used.
+        """
+        return self._deepen_grouped(qv, k, group_key=group_key, growth=growth, fetch=min(max(2 * k, 1), self.ntotal))
+
+    def search_grouped_batch(
+        self,
+        qvs: np.ndarray,
+        k: int = 5,
+        *,
+        group_key: str = "doc_id",
+        growth: int = 2,
+    ) -> list[list[dict]]:
+        """
+        search_grouped for many queries: one batched search at 2k for every row, then only
+        the rows still short of k groups are deepened on their own.
+        """
+        fetch = min(max(2 * k, 1), self.ntotal)
         out = []
-        for rank, (i, s) in enumerate(zip(idxs[0], scores[0]), start=1):
+        for i, hits in enumerate(self.search_batch(qvs, k=fetch)):
+            best = self._collapse(hits.rows, hits.scores, k, group_key)
+            if len(best) < k and fetch < self.ntotal:
+                res, _ = self._deepen_grouped(qvs[i:i + 1], k, group_key=group_key, growth=growth,
+                                              fetch=min(fetch * growth, self.ntotal))
+                out.append(res)
+            else:
+                out.append(self._grouped_hits(best, group_key))
+        return out
+
+    def _deepen_grouped(self, qv: np.ndarray, k: int, *, group_key: str, growth: int, fetch: int) -> tuple[list[dict], int]:
+        ntotal = self.ntotal
+        while True:
+            scores, idxs = self._search_ids(qv, fetch)
+            best = self._collapse(idxs[0], scores[0], k, group_key)
+            if len(best) >= k or fetch >= ntotal:
+                break
+            fetch = min(fetch * growth, ntotal)
+        return self._grouped_hits(best, group_key), fetch
+
+    def _collapse(self, idxs: np.ndarray, scores: np.ndarray, k: int, group_key: str) -> dict[str, tuple[float, int]]:
+        """First (best) row per group from a score-descending list, up to k groups."""
+        best: dict[str, tuple[float, int]] = {}
+        for i, s in zip(idxs, scores):
             if i < 0:
                 continue
-            out.append({"rank": rank, "score": float(s), **self.meta[i]})
-        return out
\ No newline at end of file
+            m = self.meta[i]
+            for g in [m.get(group_key)] + [a.get(group_key) for a in m.get("aliases") or []]:
+                if g is None or g in best:
+                    continue  # hits arrive score-descending: first one per group is its best
+                best[g] = (float(s), int(i))
+                if len(best) >= k:
+                    return best
+        return best
+
+    def _grouped_hits(self, best: dict[str, tuple[float, int]], group_key: str) -> HitList:
+        return HitList(
+            [Hit(self.meta, i, rank, s, self._alias_view(i, group_key, g))
+             for rank, (g, (s, i)) in enumerate(best.items(), start=1)],
+            meta=self.meta,
+        )
+
+    def search_doc_first(self, qv: np.ndarray, k: int = 5, n_docs: int | None = None) -> list[dict]:
+        """
+        Doc-level retrieval: search the pooled doc index for n_docs (default
+        k * DOC_FIRST_OVERFETCH) candidate docs, then score only those docs' chunks.
+        Returns the best chunk of the k candidate docs whose best chunk scores highest,
+        ordered by chunk score, with the pooled "doc_score".
+        """
+        if self.doc_index is None or self.doc_meta is None:
+            raise RuntimeError("No doc-level index loaded (build with doc_pooling='mean' or 'max').")
+
+        n_docs = min(n_docs or k * DOC_FIRST_OVERFETCH, self.doc_index.ntotal)
+        doc_scores, doc_idxs = self.doc_index.search(qv, n_docs)
+
+        hits = []
+        for d, ds in zip(doc_idxs[0], doc_scores[0]):
+            if d < 0:
+                continue
+            rows = np.asarray(self.doc_meta[d]["chunk_rows"], dtype=np.int64)
+            scores = self._vectors(rows) @ qv[0]
+            best = int(np.argmax(scores))
+            hits.append((float(scores[best]), int(rows[best]), float(ds), self.doc_meta[d]["doc_id"]))
+
+        hits.sort(key=lambda h: -h[0])
+        # a row shared with another doc (cross-doc dedup) is reported as this doc's alias
+        return HitList(
+            [Hit(self.meta, i, rank, s, {"doc_score": ds, **(self._alias_view(i, "doc_id", doc) or {})})
+             for rank, (s, i, ds, doc) in enumerate(hits[:k], start=1)],
+            meta=self.meta,
+        )
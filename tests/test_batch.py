@@ -0,0 +1,44 @@
+# tests/test_batch.py
+import json
+from types import SimpleNamespace
+
+from src.eval import search_wrappers
+from src.llm.batch import CHAT_URL, LocalBatchExecutor
+from src.llm.client import record_usage, usage_since, usage_snapshot
+
+
+def _base_search(query, k):
+    record_usage("embedding", SimpleNamespace(prompt_tokens=3, completion_tokens=0))
+    return [{"rank": i + 1, "score": 1.0 - i / 10, "chunk_id": f"{query}_c{i}", "doc_id": f"{query}_d{i}"} for i in range(3)]
+
+
+def _handler(url, body):
+    assert url == CHAT_URL
+    if "fails" in json.dumps(body["messages"]):
+        raise RuntimeError("upstream 500")
+    content = json.dumps({"best_rank": 3})
+    return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 10, "completion_tokens": 2}}
+
+
+def test_batch_rerank_falls_back_per_failed_request(tmp_path, monkeypatch):
+    sync_calls = []
+    monkeypatch.setattr(search_wrappers, "llm_rerank_order",
+                        lambda q, cands, **kw: sync_calls.append(q) or [1, 0, 2])
+
+    search_fn = search_wrappers.make_batch_rerank_search_fn(
+        _base_search, ["ok", "fails"], executor=LocalBatchExecutor(_handler), work_dir=tmp_path,
+        k_vec=3, mode="top1", poll_interval_s=0.01,
+    )
+    search_fn.join()
+    assert search_fn.batch_stats["n_requests"] == 2 and search_fn.batch_stats["n_failed"] == 1
+
+    before = usage_snapshot()
+    ok = search_fn("ok", 2)
+    failed = search_fn("fails", 2)
+    used = usage_since(before)
+
+    assert [r["chunk_id"] for r in ok] == ["ok_c2", "ok_c0"]
+    assert [r["chunk_id"] for r in failed] == ["fails_c1", "fails_c0"]
+    assert sync_calls == ["fails"]
+    # shortlist embeddings are charged when each query is served, like the sync wrapper
+    assert used["embedding_calls"] == 2 and used["rerank_calls"] == 1
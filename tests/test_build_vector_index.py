@@ -0,0 +1,53 @@
+# tests/test_build_vector_index.py
+import hashlib
+import json
+
+import numpy as np
+
+from src.retrieval import build_vector_index as bvi
+
+
+def _fake_embed(texts, model=None, batch_size=None):
+    rows = [np.frombuffer(hashlib.sha256(f"{model}|{t}".encode()).digest(), dtype=np.uint8)[:16] for t in texts]
+    return np.asarray(rows, dtype=np.float32) - 127.5
+
+
+def _write_chunks(path):
+    rows = [
+        {"chunk_id": f"{c}_c{i}", "text": f"{c} text {i}", "metadata": {"doc_id": f"{c}_doc", "company": c}}
+        for c in ("Apple", "NVIDIA") for i in range(3)
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+
+def test_sharded_build_rebuilds_when_params_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(bvi, "embed_texts", _fake_embed)
+    chunks = tmp_path / "chunks.jsonl"
+    _write_chunks(chunks)
+    kw = dict(chunks_path=chunks, shards_dir=tmp_path / "shards", embed_model="m1",
+              coarse_dim=None, doc_pooling=None, dedup_threshold=None)
+
+    assert bvi.build_sharded_vector_index(**kw).built == ["apple", "nvidia"]
+    assert bvi.build_sharded_vector_index(**kw).skipped == ["apple", "nvidia"]
+    # same chunks, different embedding model: both shards must be rebuilt
+    res = bvi.build_sharded_vector_index(**{**kw, "embed_model": "m2"})
+    assert res.built == ["apple", "nvidia"] and res.skipped == []
+    cfg = json.loads((tmp_path / "shards" / "apple" / "build_config.json").read_text(encoding="utf-8"))
+    assert cfg["embed_model"] == "m2"
+
+
+def test_forced_versioned_build_publishes_a_new_version(tmp_path, monkeypatch):
+    from src.retrieval.artifacts import read_current_version
+
+    monkeypatch.setattr(bvi, "embed_texts", _fake_embed)
+    chunks = tmp_path / "chunks.jsonl"
+    _write_chunks(chunks)
+    root = tmp_path / "faiss"
+    kw = dict(chunks_path=chunks, index_root=root, embed_model="m1", coarse_dim=None, doc_pooling=None, dedup_threshold=None)
+
+    first = bvi.build_versioned_index(**kw)
+    assert bvi.build_versioned_index(**kw).reused
+    forced = bvi.build_versioned_index(force=True, **kw)
+    assert not forced.reused and forced.version_id != first.version_id
+    assert read_current_version(root) == forced.version_id
+    assert (root / "versions" / first.version_id / "index.bin").exists()   # old version untouched
@@ -0,0 +1,35 @@
+# tests/test_client.py
+import threading
+import time
+
+from src.llm import client
+
+
+def test_hedge_timer_ignores_pool_queue_wait():
+    release = threading.Event()
+    blockers = [client._HEDGE_POOL.submit(release.wait) for _ in range(client._HEDGE_POOL._max_workers)]
+    threading.Timer(0.3, release.set).start()   # pool saturated for longer than hedge_after_s
+
+    calls = []
+    def fn(t):
+        calls.append(t)
+        time.sleep(0.05)
+        return "ok"
+
+    before = client.resilience_stats().get("hedges", 0)
+    assert client._hedged(fn, timeout_s=2.0, hedge_after_s=0.2) == "ok"
+    assert len(calls) == 1
+    assert client.resilience_stats().get("hedges", 0) == before
+    for b in blockers:
+        b.result()
+
+
+def test_slow_attempt_is_hedged():
+    def fn(t, _n=[]):
+        _n.append(1)
+        time.sleep(0.5 if len(_n) == 1 else 0.0)
+        return len(_n)
+
+    before = client.resilience_stats().get("hedge_wins", 0)
+    assert client._hedged(fn, timeout_s=2.0, hedge_after_s=0.05) == 2
+    assert client.resilience_stats().get("hedge_wins", 0) == before + 1
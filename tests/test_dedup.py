@@ -0,0 +1,54 @@
+# tests/test_dedup.py
+import faiss
+import numpy as np
+
+from src.eval.search_wrappers import make_vectorstore_search_fn
+from src.retrieval.dedup import find_near_duplicates
+from src.retrieval.vector_store import VectorStore
+
+BOILER = [1.0, 0.0, 0.0]
+
+
+def test_boilerplate_collapses_across_docs():
+    vecs = np.array([[0.0, 1.0, 0.0], BOILER, [0.0, 0.0, 1.0], BOILER, BOILER], dtype=np.float32)
+    dd = find_near_duplicates(vecs, threshold=0.99)
+    assert dd.canonical_of == [0, 1, 2, 1, 1]
+    assert dd.keep_rows == [0, 1, 2]
+
+
+def _store_with_cross_doc_alias() -> VectorStore:
+    # apple_c1 is canonical for the boilerplate chunk; meta_c1 was collapsed into it
+    vecs = np.array([[0.6, 0.8, 0.0], BOILER, [0.0, 0.0, 1.0]], dtype=np.float32)
+    index = faiss.IndexFlatIP(3)
+    index.add(vecs)
+    meta = [
+        {"chunk_id": "apple_c0", "doc_id": "apple"},
+        {"chunk_id": "apple_c1", "doc_id": "apple", "aliases": [{"chunk_id": "meta_c1", "doc_id": "meta"}]},
+        {"chunk_id": "meta_c0", "doc_id": "meta"},
+    ]
+    doc_index = faiss.IndexFlatIP(3)
+    doc_index.add(np.array([[0.8, 0.6, 0.0], [0.8, 0.0, 0.6]], dtype=np.float32))
+    doc_meta = [{"doc_id": "apple", "chunk_rows": [0, 1]}, {"doc_id": "meta", "chunk_rows": [1, 2]}]
+    return VectorStore(index=index, meta=meta, doc_index=doc_index, doc_meta=doc_meta)
+
+
+def test_doc_level_search_resolves_cross_doc_aliases():
+    vs = _store_with_cross_doc_alias()
+    qv = np.array([BOILER], dtype=np.float32)
+
+    grouped, _ = vs.search_grouped(qv, k=2)
+    assert [(h["doc_id"], h["chunk_id"]) for h in grouped] == [("apple", "apple_c1"), ("meta", "meta_c1")]
+    assert grouped[1]["alias_of"] == "apple_c1"
+
+    doc_first = vs.search_doc_first(qv, k=2)
+    assert sorted(h["doc_id"] for h in doc_first) == ["apple", "meta"]
+    assert {h["doc_id"]: h["chunk_id"] for h in doc_first}["meta"] == "meta_c1"
+
+
+def test_chunk_search_can_expand_aliases():
+    vs = _store_with_cross_doc_alias()
+    embed = lambda q: np.array(BOILER, dtype=np.float32)
+    plain = make_vectorstore_search_fn(vs, embed_query=embed)("boilerplate", 2)
+    expanded = make_vectorstore_search_fn(vs, embed_query=embed, expand_aliases=True)("boilerplate", 2)
+    assert [h["chunk_id"] for h in plain] == ["apple_c1", "apple_c0"]
+    assert [(h["chunk_id"], h["rank"]) for h in expanded] == [("apple_c1", 1), ("meta_c1", 2)]
@@ -0,0 +1,27 @@
+# tests/test_rag_runtime.py
+from src.app import rag_runtime
+from src.retrieval import build_vector_index as bvi
+from src.retrieval.artifacts import write_current_pointer
+from src.retrieval.relevance_gate import RelevanceGate
+from tests.test_build_vector_index import _fake_embed, _write_chunks
+
+
+def test_gate_only_applies_to_the_index_it_was_calibrated_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(bvi, "embed_texts", _fake_embed)
+    gate_path = tmp_path / "relevance_gate.json"
+    monkeypatch.setattr(rag_runtime, "RELEVANCE_GATE_PATH", gate_path)
+    chunks = tmp_path / "chunks.jsonl"
+    _write_chunks(chunks)
+    root = tmp_path / "faiss"
+    kw = dict(chunks_path=chunks, index_root=root, coarse_dim=None, doc_pooling=None, dedup_threshold=None)
+    v1 = bvi.build_versioned_index(embed_model="m1", **kw).version_id
+    v2 = bvi.build_versioned_index(embed_model="m2", **kw).version_id
+
+    RelevanceGate(min_top1=0.5, index_version=v1, embed_model="m1").save(gate_path)
+
+    write_current_pointer(root, v1)
+    slot = rag_runtime._load_slot(root)
+    assert slot.embed_model == "m1" and slot.gate is not None and slot.gate.min_top1 == 0.5
+
+    write_current_pointer(root, v2)
+    assert rag_runtime._load_slot(root).gate is None   # stale thresholds are not applied
@@ -0,0 +1,29 @@
+# tests/test_rerank.py
+from src.llm.rerank import build_listwise_messages, parse_listwise_order
+
+
+def test_listwise_order_is_applied():
+    assert parse_listwise_order('{"order": [3, 1, 2]}', 3) == [2, 0, 1]
+
+
+def test_listwise_order_drops_duplicate_unknown_and_non_integer_handles():
+    text = 'Sure: {"order": [2, 2, 9, 0, "x", 1.5, null, true, "[3]", "1"]}'
+    assert parse_listwise_order(text, 4) == [1, 2, 0, 3]
+
+
+def test_omitted_candidates_keep_vector_order():
+    assert parse_listwise_order('{"order": [4]}', 5) == [3, 0, 1, 2, 4]
+    assert parse_listwise_order("no json here", 3) == [0, 1, 2]
+    assert parse_listwise_order('{"order": "3,1"}', 3) == [0, 1, 2]
+
+
+def test_listwise_prompt_lists_each_doc_header_once():
+    cands = [
+        {"doc_id": "d1", "company": "NVIDIA", "year": 2024, "section": "Item 7", "source": "sec_10k_html", "text_preview": "a"},
+        {"doc_id": "d1", "company": "NVIDIA", "year": 2024, "section": "Item 7", "text_preview": "b"},
+        {"doc_id": "d2", "text": "c"},
+    ]
+    user = build_listwise_messages("q", cands)[-1]["content"]
+    assert "D1: NVIDIA | 2024 | Item 7" in user and "D2: d2" in user
+    assert "sec_10k_html" not in user
+    assert "[2] D1: b" in user
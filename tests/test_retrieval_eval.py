@@ -0,0 +1,71 @@
+# tests/test_retrieval_eval.py
+import json
+
+import faiss
+import numpy as np
+
+from src.eval.retrieval_eval import evaluate_retrieval
+from src.retrieval.vector_store import VectorStore
+
+
+def _tiny_store() -> VectorStore:
+    vecs = np.eye(3, dtype=np.float32)
+    index = faiss.IndexFlatIP(3)
+    index.add(vecs)
+    meta = [{"doc_id": f"d{i}", "chunk_id": f"d{i}_c0", "text": f"chunk {i}"} for i in range(3)]
+    return VectorStore(index=index, meta=meta)
+
+
+def test_fail_file_from_search_by_vector_hits_is_json(tmp_path):
+    vs = _tiny_store()
+    search_fn = lambda query, k: vs.search_by_vector(np.array([[1.0, 0.0, 0.0]], dtype=np.float32), k=k)
+    questions = [{"qid": "q1", "query": "anything", "gold_doc_ids": ["d2"]}]
+    fail_path = tmp_path / "fails.jsonl"
+
+    metrics, fails = evaluate_retrieval(questions, k=1, search_fn=search_fn, save_fail_path=fail_path)
+
+    assert metrics["n_fail"] == 1
+    row = json.loads(fail_path.read_text(encoding="utf-8").splitlines()[0])
+    assert row["top5"][0]["doc_id"] == "d0"
+    assert row["top5"][0]["rank"] == 1
+
+
+def test_checkpoint_is_dropped_when_the_run_config_changes(tmp_path):
+    from src.eval.retrieval_eval import collect_predictions
+
+    questions = [{"qid": "q1", "query": "anything", "gold_doc_ids": ["d0"]}]
+    ckpt = tmp_path / "predictions.jsonl"
+    calls = []
+    def search_fn(query, k):
+        calls.append(query)
+        return [{"rank": 1, "score": 1.0, "doc_id": "d0", "chunk_id": "d0_c0"}]
+
+    v1 = {"index_version": "v1", "ks": [1]}
+    collect_predictions(questions, k=1, search_fn=search_fn, checkpoint_path=ckpt, checkpoint_meta=v1)
+    collect_predictions(questions, k=1, search_fn=search_fn, checkpoint_path=ckpt, checkpoint_meta=v1)
+    assert len(calls) == 1   # resumed
+
+    preds, _ = collect_predictions(questions, k=1, search_fn=search_fn, checkpoint_path=ckpt,
+                                   checkpoint_meta={"index_version": "v2", "ks": [1]})
+    assert len(calls) == 2 and preds["q1"][0]["doc_id"] == "d0"
+    assert json.loads(ckpt.read_text(encoding="utf-8").splitlines()[0]) == {"checkpoint": {"index_version": "v2", "ks": [1]}}
+
+
+def test_pipelined_suites_share_one_vector_stage():
+    from src.eval.retrieval_eval import run_pipelined_eval_suite, run_vector_stage
+
+    vs = _tiny_store()
+    questions = [{"qid": "q1", "query": "q one", "gold_doc_ids": ["d0"]},
+                 {"qid": "q2", "query": "q two", "gold_doc_ids": ["d1"]}]
+    embedded = []
+    def embed_batch(texts):
+        embedded.extend(texts)
+        return np.eye(3, dtype=np.float32)[: len(texts)]
+
+    stage = run_vector_stage(questions, vs=vs, depth=3, embed_batch=embed_batch)
+    for _ in range(2):
+        suite = run_pipelined_eval_suite(questions, vs=vs, ks=(1, 3), vector_stage=stage, expand_aliases=True)
+        assert suite["results"]["1"]["recall_at_k"] == 1.0
+
+    assert embedded == ["q one", "q two"]
+    assert [h["rank"] for h in stage.lists["q one"]] == [1, 2, 3]
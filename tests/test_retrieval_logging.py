@@ -0,0 +1,45 @@
+# tests/test_retrieval_logging.py
+import gzip
+import json
+import threading
+
+from src.eval.retrieval_logging import AsyncRetrievalLogger, aggregate_log_stats
+
+HIT = {"rank": 1, "score": 0.5, "chunk_id": "c1", "doc_id": "d1", "ticker": "ACME"}
+
+
+def test_full_queue_drops_are_counted_across_threads(tmp_path):
+    logger = AsyncRetrievalLogger(tmp_path / "retrieval.jsonl", max_queue=1, flush_interval_s=0.01)
+    logger.close()  # writer stopped: the queue stays full after the first record
+
+    def spam():
+        for _ in range(500):
+            logger.log(query="q", results=[HIT])
+    threads = [threading.Thread(target=spam) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert logger.dropped == 8 * 500 - 1
+
+
+def test_rotation_uses_the_files_first_record_and_stats_read_gz(tmp_path):
+    log_path = tmp_path / "retrieval.jsonl"
+    old = {"timestamp": "2020-01-01T00:00:00Z", "query": "old", "top_k": 1, "results": [HIT], "comment": None}
+    log_path.write_text(json.dumps(old) + "\n", encoding="utf-8")
+
+    # a freshly started process must still see the file as two days old
+    logger = AsyncRetrievalLogger(log_path, max_age_s=3600, flush_interval_s=0.01)
+    logger.log(query="new", results=[HIT])
+    logger.close()
+
+    rotated = list(tmp_path.glob("retrieval.*.jsonl.gz"))
+    assert len(rotated) == 1
+    with gzip.open(rotated[0], "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["query"] == "old"
+    assert [json.loads(l)["query"] for l in log_path.read_text(encoding="utf-8").splitlines()] == ["new"]
+
+    stats = aggregate_log_stats(log_path)
+    assert stats["2020-01-01|ACME"]["n_hits"] == 1
+    assert sum(v["n_hits"] for v in stats.values()) == 2
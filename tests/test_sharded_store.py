@@ -0,0 +1,41 @@
+# tests/test_sharded_store.py
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from src.eval.search_wrappers import prefetch_vector_search
+from src.retrieval.sharded_store import ShardedVectorStore
+from src.retrieval.vector_store import VectorStore
+
+
+def _shard(doc_ids: list[str], vecs: np.ndarray) -> VectorStore:
+    index = faiss.IndexFlatIP(vecs.shape[1])
+    index.add(vecs.astype(np.float32))
+    return VectorStore(index=index, meta=[{"doc_id": d, "chunk_id": f"{d}_c0"} for d in doc_ids])
+
+
+def _store() -> ShardedVectorStore:
+    eye = np.eye(4, dtype=np.float32)
+    shards = {"a": _shard(["a0", "a1"], eye[:2]), "b": _shard(["b2", "b3"], eye[2:])}
+    return ShardedVectorStore(shard_key="company", shards=shards, _pool=ThreadPoolExecutor(max_workers=2))
+
+
+def test_search_batch_matches_per_row_search():
+    vs = _store()
+    qvs = np.array([[0.9, 0.0, 0.1, 0.0], [0.0, 0.2, 0.0, 0.8]], dtype=np.float32)
+    batched = vs.search_batch(qvs, k=2)
+    for i in range(len(qvs)):
+        single = vs.search_by_vector(qvs[i:i + 1], k=2)
+        assert [(r["doc_id"], r["rank"]) for r in batched[i]] == [(r["doc_id"], r["rank"]) for r in single]
+    assert [r["doc_id"] for r in batched[1]] == ["b3", "a1"]
+    vs.close()
+
+
+def test_prefetch_vector_search_accepts_sharded_store():
+    vs = _store()
+    embed = lambda qs: np.eye(4, dtype=np.float32)[[int(q) for q in qs]]
+    out = prefetch_vector_search(vs, ["0", "3"], k=1, embed_batch=embed)
+    assert out["0"][0]["doc_id"] == "a0"
+    assert out["3"][0]["doc_id"] == "b3"
+    vs.close()
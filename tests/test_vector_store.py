@@ -0,0 +1,49 @@
+# tests/test_vector_store.py
+import json
+
+import faiss
+import numpy as np
+
+from src.retrieval.vector_store import FULL_VECS_NAME, VectorStore, l2_normalize, truncate_and_normalize
+
+
+def test_coarse_load_keeps_full_index_on_disk(tmp_path):
+    rng = np.random.default_rng(0)
+    vecs = l2_normalize(rng.standard_normal((50, 16)).astype(np.float32))
+    index = faiss.IndexFlatIP(16)
+    index.add(vecs)
+    coarse = faiss.IndexFlatIP(4)
+    coarse.add(truncate_and_normalize(vecs, 4))
+    faiss.write_index(index, str(tmp_path / "index.bin"))
+    faiss.write_index(coarse, str(tmp_path / "index_coarse.bin"))
+    np.save(tmp_path / FULL_VECS_NAME, vecs.astype(np.float16))
+    (tmp_path / "meta.jsonl").write_text(
+        "".join(json.dumps({"chunk_id": f"c{i}", "doc_id": f"d{i % 5}"}) + "\n" for i in range(50)), encoding="utf-8")
+
+    vs = VectorStore.load(tmp_path / "index.bin", tmp_path / "meta.jsonl", coarse_index_path=tmp_path / "index_coarse.bin")
+    assert vs.index is None and isinstance(vs.full_vecs, np.memmap)
+    assert vs.ntotal == 50
+
+    qv = vecs[7:8]
+    hits = vs.search_by_vector(qv, k=3)
+    assert hits[0]["chunk_id"] == "c7"
+    assert abs(hits[0]["score"] - 1.0) < 1e-2
+    grouped, _ = vs.search_grouped(qv, k=5)
+    assert len({h["doc_id"] for h in grouped}) == 5
+
+
+def test_grouped_batch_matches_per_row_grouped_search():
+    rng = np.random.default_rng(1)
+    vecs = l2_normalize(rng.standard_normal((60, 8)).astype(np.float32))
+    index = faiss.IndexFlatIP(8)
+    index.add(vecs)
+    # doc d0 owns most rows, so some queries need deepening past 2k to find k docs
+    meta = [{"chunk_id": f"c{i}", "doc_id": "d0" if i % 6 else f"d{i}"} for i in range(60)]
+    vs = VectorStore(index=index, meta=meta)
+
+    qvs = vecs[:6]
+    batched = vs.search_grouped_batch(qvs, k=4)
+    for qv, got in zip(qvs, batched):
+        want, _ = vs.search_grouped(qv[None, :], k=4)
+        assert [h["chunk_id"] for h in got] == [h["chunk_id"] for h in want]
+        assert [h["rank"] for h in got] == [1, 2, 3, 4]